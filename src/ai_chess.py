@@ -1,23 +1,53 @@
-import copy
 import random
 import time
 
 from board import Board
 from move import Move
+from bitboard import COLOR_INDEX, GEN_CAPTURES
+from movepick import MovePicker, is_quiet, order_moves, capture_score, see
+from transposition import TranspositionTable, BOUND_EXACT, BOUND_LOWER, BOUND_UPPER
+import evaluation
+import endgame
 from const import *
 
 
+# raised inside the search when the time budget is used up
+class SearchTimeout(Exception):
+    pass
+
+
 class AI_engine:
 
-    def __init__(self):
+    def __init__(self, tt=None, tablebase=None):
         self.valid_moves = []
+        # search info of the last search() call
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.pv = []
+        self.deadline = None
+        self.stopped = False
+        # results shared between iterations and searches, may be shared between processes
+        self.tt = tt if tt is not None else TranspositionTable(TT_SIZE_MB)
+        # endgame tables, None if none were generated
+        self.tablebase = tablebase if tablebase is not None else endgame.load(TABLEBASE_DIR)
+        # moves searched at the root, a subset of them when the root is split between workers
+        self.root_moves = []
+        self.restricted_root = False
+        # one move list per ply and stage, refilled by the generator instead of allocating new lists
+        self.move_lists = [[] for _ in range(MAX_SEARCH_DEPTH + 1)]
+        self.quiet_lists = [[] for _ in range(MAX_SEARCH_DEPTH + 1)]
+        # quiet moves that caused a cutoff, two per ply
+        self.killers = [[0, 0] for _ in range(MAX_SEARCH_DEPTH + 1)]
+        # cutoffs of quiet moves weighted by depth, indexed by from * 64 + to
+        self.history = [0] * 4096
 
     # gets random moves of possible moves
     def get_random_move(self) -> Move:
         rand_num = random.randint(0, len(self.valid_moves) - 1)
         return self.valid_moves[rand_num]
 
-    # shows the best move using a greedy algorithm for one move for now
+    # shows the best move one move deep, every move is followed by the captures that answer it
     def get_best_move(self, board: Board, player_coefficient: int) -> Move:
 
         # score equals -inf
@@ -29,26 +59,26 @@ class AI_engine:
         # loop through possible moves
         for move in self.valid_moves:
 
-            # copy a board to make a move there
-            temp_board = copy.deepcopy(board)
-
-            # initialize move
-            initial = move.initial
-            final = move.final
-            piece = temp_board.squares[initial.row][initial.col].piece
-
-            # make a move
-            temp_board.move(piece, move)
+            # make a move in place, no copy of the board needed
+            board.make_move(move)
             temp_score = 0
 
-            if temp_board.checkmate:
-                temp_score = CHECKMATE_VALUE
-
-            elif temp_board.stalemate:
-                temp_score = STALEMATE_VALUE
+            if not board.position.has_legal_move():
+                if board.position.in_check(board.position.turn):
+                    temp_score = CHECKMATE_VALUE
+                else:
+                    temp_score = STALEMATE_VALUE
 
             else:
-                temp_score = temp_board.count_score() * player_coefficient
+                # quiescence score of the reply side turned into white's point of view
+                self.deadline = None
+                self.stopped = False
+                reply_score = self._quiescence(board.position, -CHECKMATE_VALUE - 1, CHECKMATE_VALUE + 1, 1)
+                white_score = reply_score if board.position.turn == COLOR_INDEX['white'] else -reply_score
+                temp_score = white_score * player_coefficient
+
+            # take the move back
+            board.unmake_move()
 
             # if temp_score is bigger than current score, we found better move
             if temp_score > score:
@@ -57,23 +87,220 @@ class AI_engine:
 
         return best_move
 
-    # gets all valid moves and puts them into AI_engine.valid_moves
-    def get_valid_moves(self, board: Board, color: str):
-        # loops into all squares
-        for row in range(ROWS):
-            for col in range(COLS):
+    # searches for the best move with iterative deepening alpha-beta
+    def search(self, board: Board, max_depth=MAX_SEARCH_DEPTH, time_ms=None) -> Move:
+        '''
+        :param board: board to search, left unchanged
+        :param max_depth: deepest iteration in plies
+        :param time_ms: time budget in milliseconds, None for no limit
+        :return: best move of the deepest finished iteration, None if there are no moves
+        '''
+        code = self.search_position(board.position, max_depth, time_ms)
+        return board.code_to_move(code) if code else None
+
+    # same search on a bare bitboard position, returns an encoded move or 0
+    def search_position(self, position, max_depth=MAX_SEARCH_DEPTH, time_ms=None, on_iteration=None,
+                        root_moves=None) -> int:
+        '''
+        :param position: bitboard Position, left unchanged
+        :param max_depth: deepest iteration in plies
+        :param time_ms: time budget in milliseconds, None for no limit
+        :param on_iteration: called with the engine after every finished iteration
+        :param root_moves: encoded legal moves to consider at the root, all of them by default
+        :return: best encoded move of the deepest finished iteration, 0 if there are no moves
+        '''
+        self.restricted_root = bool(root_moves)
+        root_moves = list(root_moves) if root_moves else position.legal_moves()
+        if not root_moves:
+            return 0
+        self.root_moves = order_moves(position, root_moves)
+        for killers in self.killers:
+            killers[0] = killers[1] = 0
+        self.history[:] = [0] * 4096
+
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.pv = [root_moves[0]]
+        self.stopped = False
+        self.deadline = time.perf_counter() + time_ms / 1000 if time_ms is not None else None
+        self.tt.new_search()
+        stack_size = len(position.stack)
+
+        for depth in range(1, max_depth + 1):
+            pv = []
+            try:
+                score = self._negamax(position, depth, -CHECKMATE_VALUE - 1, CHECKMATE_VALUE + 1, 0, pv)
+            except SearchTimeout:
+                # take back the moves of the interrupted iteration
+                while len(position.stack) > stack_size:
+                    position.unmake()
+                break
+            self.depth = depth
+            self.score = score
+            self.pv = pv
+            if on_iteration is not None:
+                on_iteration(self)
+            # no need to look deeper once a mate is found
+            if abs(score) >= MATE_BOUND:
+                break
+
+        return self.pv[0]
+
+    # asks a running search to return as soon as possible, safe to call from another thread
+    def stop(self):
+        self.stopped = True
+
+    # negamax with alpha-beta pruning, fills pv with the principal variation
+    def _negamax(self, position, depth, alpha, beta, ply, pv):
+        self.nodes += 1
+        if not self.nodes & 127 and (self.stopped or (
+                self.deadline is not None and time.perf_counter() > self.deadline)):
+            raise SearchTimeout()
 
-                # when finds team piece adds its valid moves
-                if board.squares[row][col].has_piece():
+        # a repeated position is scored as a draw
+        if ply > 0 and position.is_repetition():
+            return STALEMATE_VALUE
 
-                    piece = board.squares[row][col].piece
-                    if piece.color == color:
+        # positions with few pieces are scored exactly by the endgame tables
+        if ply > 0 and self.tablebase is not None:
+            score = self.tablebase.score(position, ply)
+            if score is not None:
+                return score
 
-                        # calculates possible moves
-                        board.calc_moves(piece, row, col, check=True)
-                        for move in piece.moves:
-                            # appends possible moves
-                            self.valid_moves.append(move)
+        if depth == 0:
+            return self._quiescence(position, alpha, beta, ply)
+
+        # transposition table cutoff, mate scores are stored relative to the node
+        hash_move = 0
+        entry = self.tt.probe(position.key)
+        if entry is not None:
+            entry_depth, entry_score, bound, hash_move = entry
+            if ply > 0 and entry_depth >= depth:
+                if entry_score >= MATE_BOUND:
+                    entry_score -= ply
+                elif entry_score <= -MATE_BOUND:
+                    entry_score += ply
+                if bound == BOUND_EXACT \
+                        or (bound == BOUND_LOWER and entry_score >= beta) \
+                        or (bound == BOUND_UPPER and entry_score <= alpha):
+                    return entry_score
+
+        if ply == 0:
+            # the root moves are known, the previous best move goes first
+            moves = self.root_moves[:]
+            if self.pv[0] in moves:
+                moves.remove(self.pv[0])
+                moves.insert(0, self.pv[0])
+        else:
+            # the hash move first, then the move of the previous principal variation
+            if not hash_move and ply < len(self.pv):
+                hash_move = self.pv[ply]
+            moves = MovePicker(position, hash_move, self.killers[ply], self.history,
+                               self.move_lists[ply], self.quiet_lists[ply])
+
+        alpha_orig = alpha
+        best_move = 0
+        searched = 0
+        line = []
+        for move in moves:
+            searched += 1
+            position.make(move)
+            score = -self._negamax(position, depth - 1, -beta, -alpha, ply + 1, line)
+            position.unmake()
+            if score > alpha:
+                alpha = score
+                best_move = move
+                pv[:] = [move] + line
+                if alpha >= beta:
+                    if is_quiet(move):
+                        self._update_quiet_cutoff(move, depth, ply)
+                    break
+            line.clear()
+
+        if not searched:
+            if position.in_check(position.turn):
+                # prefer shorter mates
+                return -(CHECKMATE_VALUE - ply)
+            return STALEMATE_VALUE
+
+        if alpha >= beta:
+            bound = BOUND_LOWER
+        elif alpha > alpha_orig:
+            bound = BOUND_EXACT
+        else:
+            bound = BOUND_UPPER
+        stored = alpha
+        if stored >= MATE_BOUND:
+            stored += ply
+        elif stored <= -MATE_BOUND:
+            stored -= ply
+        # a score over part of the root moves is no score of the position
+        if ply > 0 or not self.restricted_root:
+            self.tt.store(position.key, depth, stored, bound, best_move)
+        return alpha
+
+    # searches captures and promotions only until the position is quiet
+    def _quiescence(self, position, alpha, beta, ply):
+        '''
+        The side to move may stand pat on the static score unless it is in
+        check, then every evasion is searched. Captures that lose material by
+        static exchange evaluation are skipped.
+        '''
+        self.nodes += 1
+        if not self.nodes & 127 and (self.stopped or (
+                self.deadline is not None and time.perf_counter() > self.deadline)):
+            raise SearchTimeout()
+        if ply >= MAX_SEARCH_DEPTH:
+            return self._evaluate(position)
+
+        in_check = position.in_check(position.turn)
+        if in_check:
+            moves = position.legal_moves(moves=self.move_lists[ply])
+            if not moves:
+                return -(CHECKMATE_VALUE - ply)
+        else:
+            stand_pat = self._evaluate(position)
+            if stand_pat >= beta:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+            moves = position.legal_moves(moves=self.move_lists[ply], gen=GEN_CAPTURES)
+        if len(moves) > 1:
+            moves.sort(key=lambda move: capture_score(position, move), reverse=True)
+
+        for move in moves:
+            if not in_check and see(position, move) < 0:
+                continue
+            position.make(move)
+            score = -self._quiescence(position, -beta, -alpha, ply + 1)
+            position.unmake()
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        return alpha
+
+    # remembers a quiet move that caused a beta cutoff as a killer and in the history table
+    def _update_quiet_cutoff(self, move, depth, ply):
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[move & 4095] += depth * depth
+
+    # tapered material and piece-square score from the side to move's point of view, kept up to date by the position
+    def _evaluate(self, position):
+        if DEBUG_EVAL:
+            evaluation.check(position)
+        return evaluation.evaluate(position)
+
+    # gets all valid moves and puts them into AI_engine.valid_moves
+    def get_valid_moves(self, board: Board, color: str):
+        # the board's cached moves for the whole side, captures first
+        for code in order_moves(board.position, list(board.legal_codes(COLOR_INDEX[color]))):
+            # appends possible moves
+            self.valid_moves.append(board.code_to_move(code))
 
     def clear(self):
         self.valid_moves = []
@@ -0,0 +1,117 @@
+import queue
+import threading
+
+from ai_chess import AI_engine
+from const import *
+
+
+class SearchJob:
+
+    def __init__(self, position, max_depth, time_ms):
+        # private copy of the position, the board can change while the job runs
+        self.position = position
+        self.max_depth = max_depth
+        self.time_ms = time_ms
+        # best move of the deepest finished iteration so far, with its search info
+        self.best = 0
+        self.depth = 0
+        self.score = 0
+        self.nodes = 0
+        self.pv = []
+        # final encoded move, set once done
+        self.result = 0
+        self.cancelled = False
+        self.finished = threading.Event()
+
+    # checks if the search is over
+    def done(self) -> bool:
+        return self.finished.is_set()
+
+    # blocks until the search is over, returns the encoded move or None on timeout
+    def wait(self, timeout=None):
+        if not self.finished.wait(timeout):
+            return None
+        return self.result
+
+
+class AIWorker:
+    '''
+    Runs AI_engine searches in a background thread so the window keeps
+    rendering and handling keys while the engine thinks.
+
+        job = worker.submit(board, time_ms=1000)
+        ...
+        if job.done():
+            move = board.code_to_move(job.result)
+    '''
+
+    def __init__(self, engine=None):
+        self.engine = engine if engine is not None else AI_engine()
+        self.jobs = queue.Queue()
+        self.job = None
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name='ai-worker', daemon=True)
+        self.thread.start()
+
+    # queues a search of the board's current position, cancelling the running one
+    def submit(self, board, time_ms=AI_TIME_MS, max_depth=MAX_SEARCH_DEPTH) -> SearchJob:
+        '''
+        :param board: Board to search, copied so it can change right away
+        :param time_ms: time budget in milliseconds, None for no limit
+        :param max_depth: deepest iteration in plies
+        :return: job to poll or wait on
+        '''
+        self.cancel()
+        job = SearchJob(board.position.copy(), max_depth, time_ms)
+        self.jobs.put(job)
+        return job
+
+    # cancels the running job, its result is dropped
+    def cancel(self):
+        with self.lock:
+            if self.job is not None:
+                self.job.cancelled = True
+                self.engine.stop()
+        # jobs that have not started yet are dropped too
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                job.cancelled = True
+                job.finished.set()
+
+    # stops the worker thread
+    def close(self):
+        self.cancel()
+        self.jobs.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            with self.lock:
+                if job.cancelled:
+                    job.finished.set()
+                    continue
+                self.job = job
+
+            def progress(engine, job=job):
+                # a cancel that raced with the start of the search
+                if job.cancelled:
+                    engine.stop()
+                job.best = engine.pv[0]
+                job.depth = engine.depth
+                job.score = engine.score
+                job.nodes = engine.nodes
+                job.pv = list(engine.pv)
+
+            job.result = self.engine.search_position(job.position, job.max_depth, job.time_ms, progress)
+            job.nodes = self.engine.nodes
+
+            with self.lock:
+                self.job = None
+            job.finished.set()
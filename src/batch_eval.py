@@ -0,0 +1,128 @@
+'''
+Vectorized evaluation of many positions at once with NumPy.
+
+Positions are exported as an N x 12 x 64 occupancy array (planes[n, code, sq]
+is 1 when the piece with mailbox code `code` stands on `sq`) and scored in one
+call with the tables of evaluation.py, so a batch scores exactly like the
+search scores a single position, custom weights included.
+
+    planes = batch_eval.to_planes(boards)             # Boards or Positions
+    scores = batch_eval.score_planes(planes)          # centipawns, white's view
+
+    python batch_eval.py --fens positions.fen --weights weights.json
+
+NumPy is only needed by this module; the game and the engine run without it.
+'''
+import argparse
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import evaluation
+from bitboard import Position
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('batch evaluation needs NumPy: pip install numpy')
+
+
+# N x 12 x 64 uint8 occupancy planes of Boards or Positions
+def to_planes(items):
+    '''
+    :param items: iterable of Board or Position
+    :return: numpy array of shape (N, 12, 64)
+    '''
+    _require_numpy()
+    mailboxes = np.array([getattr(item, 'position', item).board for item in items], dtype=np.int8).reshape(-1, 64)
+    return (mailboxes[:, None, :] == np.arange(12, dtype=np.int8)[None, :, None]).astype(np.uint8)
+
+
+# side to move of Boards or Positions, 0 for white and 1 for black
+def to_turns(items):
+    _require_numpy()
+    return np.array([getattr(item, 'position', item).turn for item in items], dtype=np.int8)
+
+
+# the evaluation tables as arrays, read again on every call so loaded weights apply
+def weight_arrays():
+    '''
+    :return: (mg (12, 64), eg (12, 64), phase (12,)) int64 arrays
+    '''
+    _require_numpy()
+    return (np.array(evaluation.MG_TABLE, dtype=np.int64),
+            np.array(evaluation.EG_TABLE, dtype=np.int64),
+            np.array(evaluation.PHASE_TABLE, dtype=np.int64))
+
+
+# tapered scores of a batch in centipawns
+def score_planes(planes, turns=None):
+    '''
+    :param planes: (N, 12, 64) occupancy array
+    :param turns: side to move per position; scores are from white's point of view if None
+    :return: (N,) int64 array, equal to evaluation.evaluate_white / evaluate per position
+    '''
+    _require_numpy()
+    mg_table, eg_table, phase_table = weight_arrays()
+    planes = np.asarray(planes).reshape(-1, 12 * 64).astype(np.int64)
+    mg = planes @ mg_table.reshape(-1)
+    eg = planes @ eg_table.reshape(-1)
+    phase = np.minimum(planes.reshape(-1, 12, 64).sum(axis=2) @ phase_table, evaluation.MAX_PHASE)
+    scores = (mg * phase + eg * (evaluation.MAX_PHASE - phase)) // evaluation.MAX_PHASE
+    if turns is not None:
+        scores = np.where(np.asarray(turns) == 0, scores, -scores)
+    return scores
+
+
+# scores Boards or Positions, from white's point of view or the side to move's
+def score_positions(items, side_to_move=False):
+    items = list(items)
+    return score_planes(to_planes(items), to_turns(items) if side_to_move else None)
+
+
+# reads one FEN per line, yields Positions
+def read_fens(file):
+    for line in file:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield Position.from_fen(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='score a file of FEN positions in batches')
+    parser.add_argument('--fens', required=True, help='file with one FEN per line')
+    parser.add_argument('--weights', help='JSON weights written by evaluation.save_weights')
+    parser.add_argument('--batch', type=int, default=4096, help='positions per vectorized call')
+    parser.add_argument('--side-to-move', action='store_true', help="scores from the side to move's point of view")
+    args = parser.parse_args(argv)
+
+    _require_numpy()
+    if args.weights:
+        evaluation.load_weights(args.weights)
+
+    count = 0
+    start = time.perf_counter()
+    with open(args.fens) as file:
+        batch = []
+        for position in read_fens(file):
+            batch.append(position)
+            if len(batch) == args.batch:
+                for score in score_positions(batch, args.side_to_move):
+                    print(int(score))
+                count += len(batch)
+                batch = []
+        if batch:
+            for score in score_positions(batch, args.side_to_move):
+                print(int(score))
+            count += len(batch)
+    seconds = time.perf_counter() - start
+    print(f'{count} positions in {seconds:.3f} s', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,931 @@
+'''
+Bitboard position used by Board for move generation.
+
+Squares are numbered a1 = 0 ... h8 = 63, so bit n of a bitboard is set when
+square n is occupied. Board keeps its (row, col) squares for the interface and
+translates with square_index() / row_col().
+'''
+
+import random
+
+from evaluation import MG_TABLE, EG_TABLE, PHASE_TABLE, full_terms
+
+# colors
+WHITE = 0
+BLACK = 1
+COLOR_NAMES = ('white', 'black')
+COLOR_INDEX = {'white': WHITE, 'black': BLACK}
+
+# piece types
+PAWN = 0
+KNIGHT = 1
+BISHOP = 2
+ROOK = 3
+QUEEN = 4
+KING = 5
+PIECE_NAMES = ('pawn', 'knight', 'bishop', 'rook', 'queen', 'king')
+PIECE_INDEX = {name: i for i, name in enumerate(PIECE_NAMES)}
+
+# mailbox value of an empty square
+NO_PIECE = -1
+
+# castling rights
+WHITE_OO = 1
+WHITE_OOO = 2
+BLACK_OO = 4
+BLACK_OOO = 8
+
+# useful masks
+FULL = 0xFFFFFFFFFFFFFFFF
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+RANK_1 = 0xFF
+RANK_3 = RANK_1 << 16
+RANK_6 = RANK_1 << 40
+RANK_8 = RANK_1 << 56
+
+# ray directions: positive ones grow the square index, negative ones shrink it
+NORTH, NORTH_EAST, EAST, NORTH_WEST, SOUTH, SOUTH_WEST, WEST, SOUTH_EAST = range(8)
+_DIRECTIONS = (
+    (1, 0),  # north
+    (1, 1),  # north-east
+    (0, 1),  # east
+    (1, -1),  # north-west
+    (-1, 0),  # south
+    (-1, -1),  # south-west
+    (0, -1),  # west
+    (-1, 1),  # south-east
+)
+
+
+def square_index(row, col):
+    '''
+    :param row: Board row (0 is black's back rank)
+    :param col: Board col (0 is the a-file)
+    :return: bitboard square index
+    '''
+    return (7 - row) * 8 + col
+
+
+def row_col(sq):
+    '''
+    :param sq: bitboard square index
+    :return: (row, col) of Board.squares
+    '''
+    return 7 - (sq >> 3), sq & 7
+
+
+def iter_bits(bb):
+    '''
+    yields square indexes of all set bits, lowest first
+    '''
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+
+def popcount(bb):
+    return bin(bb).count('1')
+
+
+# move encoding: from | to << 6 | promotion << 12 | flags, promotion is 0 or a piece type
+FLAG_CAPTURE = 1 << 15
+FLAG_EN_PASSANT = 1 << 16
+FLAG_CASTLE = 1 << 17
+# from, to and promotion without the flags
+MOVE_MASK = 0x7FFF
+
+# move generation stages: captures and promotions, the other moves, or both
+GEN_CAPTURES = 1
+GEN_QUIETS = 2
+GEN_ALL = GEN_CAPTURES | GEN_QUIETS
+
+
+def encode_move(frm, to, promo=0, flags=0):
+    return frm | (to << 6) | (promo << 12) | flags
+
+
+def move_from(move):
+    return move & 63
+
+
+def move_to(move):
+    return (move >> 6) & 63
+
+
+def move_promo(move):
+    return (move >> 12) & 7
+
+
+def move_flags(move):
+    return move & ~MOVE_MASK
+
+
+def square_name(sq):
+    return 'abcdefgh'[sq & 7] + str((sq >> 3) + 1)
+
+
+# coordinate notation of a move, e.g. e2e4 or e7e8q
+def move_name(move):
+    promo = move_promo(move)
+    return square_name(move_from(move)) + square_name(move_to(move)) + ('nbrq'[promo - 1] if promo else '')
+
+
+# precomputed attack tables
+def _leaper_table(offsets):
+    table = []
+    for sq in range(64):
+        rank, file = sq >> 3, sq & 7
+        bb = 0
+        for dr, df in offsets:
+            r, f = rank + dr, file + df
+            if 0 <= r < 8 and 0 <= f < 8:
+                bb |= 1 << (r * 8 + f)
+        table.append(bb)
+    return table
+
+
+def _ray_table():
+    table = []
+    for dr, df in _DIRECTIONS:
+        rays = []
+        for sq in range(64):
+            r, f = (sq >> 3) + dr, (sq & 7) + df
+            bb = 0
+            while 0 <= r < 8 and 0 <= f < 8:
+                bb |= 1 << (r * 8 + f)
+                r, f = r + dr, f + df
+            rays.append(bb)
+        table.append(rays)
+    return table
+
+
+KNIGHT_ATTACKS = _leaper_table([(2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1)])
+KING_ATTACKS = _leaper_table([(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)])
+PAWN_ATTACKS = [_leaper_table([(1, -1), (1, 1)]), _leaper_table([(-1, -1), (-1, 1)])]
+RAYS = _ray_table()
+
+
+
+def _between_table():
+    table = [[0] * 64 for _ in range(64)]
+    for rays in RAYS:
+        for sq in range(64):
+            for target in iter_bits(rays[sq]):
+                table[sq][target] = rays[sq] ^ rays[target] ^ (1 << target)
+    return table
+
+
+# squares strictly between two squares on a line, 0 if not on a line
+BETWEEN = _between_table()
+
+_N, _NE, _E, _NW = RAYS[NORTH], RAYS[NORTH_EAST], RAYS[EAST], RAYS[NORTH_WEST]
+_S, _SW, _W, _SE = RAYS[SOUTH], RAYS[SOUTH_WEST], RAYS[WEST], RAYS[SOUTH_EAST]
+
+
+def bishop_attacks(sq, occ):
+    '''
+    :param sq: square of the slider
+    :param occ: all occupied squares
+    :return: squares attacked diagonally from sq, first blocker included
+    '''
+    attacks = 0
+    # positive rays stop at the lowest blocker
+    ray = _NE[sq]
+    blockers = ray & occ
+    if blockers:
+        ray ^= _NE[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    ray = _NW[sq]
+    blockers = ray & occ
+    if blockers:
+        ray ^= _NW[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    # negative rays stop at the highest blocker
+    ray = _SW[sq]
+    blockers = ray & occ
+    if blockers:
+        ray ^= _SW[blockers.bit_length() - 1]
+    attacks |= ray
+    ray = _SE[sq]
+    blockers = ray & occ
+    if blockers:
+        ray ^= _SE[blockers.bit_length() - 1]
+    return attacks | ray
+
+
+def rook_attacks(sq, occ):
+    '''
+    :param sq: square of the slider
+    :param occ: all occupied squares
+    :return: squares attacked along rank and file from sq, first blocker included
+    '''
+    attacks = 0
+    ray = _N[sq]
+    blockers = ray & occ
+    if blockers:
+        ray ^= _N[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    ray = _E[sq]
+    blockers = ray & occ
+    if blockers:
+        ray ^= _E[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    ray = _S[sq]
+    blockers = ray & occ
+    if blockers:
+        ray ^= _S[blockers.bit_length() - 1]
+    attacks |= ray
+    ray = _W[sq]
+    blockers = ray & occ
+    if blockers:
+        ray ^= _W[blockers.bit_length() - 1]
+    return attacks | ray
+
+
+def queen_attacks(sq, occ):
+    return bishop_attacks(sq, occ) | rook_attacks(sq, occ)
+
+
+# castling rights that survive a move touching a square
+_CASTLE_KEEP = [0xF] * 64
+_CASTLE_KEEP[0] &= ~WHITE_OOO
+_CASTLE_KEEP[7] &= ~WHITE_OO
+_CASTLE_KEEP[4] &= ~(WHITE_OO | WHITE_OOO)
+_CASTLE_KEEP[56] &= ~BLACK_OOO
+_CASTLE_KEEP[63] &= ~BLACK_OO
+_CASTLE_KEEP[60] &= ~(BLACK_OO | BLACK_OOO)
+
+# FEN of the standard start position
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# FEN letters by mailbox code and back
+_FEN_CHARS = 'PNBRQKpnbrqk'
+_FEN_CODES = {char: code for code, char in enumerate(_FEN_CHARS)}
+
+
+# zobrist keys, fixed seed so keys are the same in every process
+def _zobrist_keys():
+    rng = random.Random(20221018)
+    pieces = [[rng.getrandbits(64) for _ in range(64)] for _ in range(12)]
+    castling = [rng.getrandbits(64) for _ in range(16)]
+    ep = [rng.getrandbits(64) for _ in range(8)]
+    return pieces, castling, ep, rng.getrandbits(64)
+
+
+ZOBRIST_PIECES, ZOBRIST_CASTLING, ZOBRIST_EP, ZOBRIST_TURN = _zobrist_keys()
+
+
+class Position:
+
+    def __init__(self):
+        # pieces[color][piece type] is a bitboard
+        self.pieces = [[0] * 6, [0] * 6]
+        self.occupied = [0, 0]
+        # mailbox: color * 6 + piece type, or NO_PIECE
+        self.board = [NO_PIECE] * 64
+        self.turn = WHITE
+        self.castling = 0
+        # en-passant target square or -1
+        self.ep = -1
+        # zobrist key of the position, updated by every change
+        self.key = 0
+        # plies since the last capture or pawn move, and the FEN move number
+        self.halfmove = 0
+        self.fullmove = 1
+        # evaluation terms kept up to date like the key, see evaluation.py
+        self.mg = 0
+        self.eg = 0
+        self.phase = 0
+        # (move, captured, castling, ep, turn, key, halfmove, mg, eg, phase) per made move
+        self.stack = []
+
+    # sets up the standard start position
+    @classmethod
+    def start(cls):
+        position = cls()
+        back_rank = (ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP, KNIGHT, ROOK)
+        for col in range(8):
+            position.put(col, WHITE, back_rank[col])
+            position.put(8 + col, WHITE, PAWN)
+            position.put(48 + col, BLACK, PAWN)
+            position.put(56 + col, BLACK, back_rank[col])
+        position.castling = WHITE_OO | WHITE_OOO | BLACK_OO | BLACK_OOO
+        position.key = position.compute_key()
+        return position
+
+    # independent copy, e.g. for a search running in another thread
+    def copy(self):
+        position = Position.__new__(Position)
+        position.pieces = [self.pieces[0][:], self.pieces[1][:]]
+        position.occupied = self.occupied[:]
+        position.board = self.board[:]
+        position.turn = self.turn
+        position.castling = self.castling
+        position.ep = self.ep
+        position.key = self.key
+        position.halfmove = self.halfmove
+        position.fullmove = self.fullmove
+        position.mg = self.mg
+        position.eg = self.eg
+        position.phase = self.phase
+        position.stack = self.stack[:]
+        return position
+
+    # sets up a position from a FEN string
+    @classmethod
+    def from_fen(cls, fen):
+        '''
+        :param fen: FEN string, move counters are optional
+        :return: new Position
+        '''
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f'invalid FEN: {fen}')
+        placement, turn, castling, ep = fields[:4]
+
+        position = cls()
+        ranks = placement.split('/')
+        if len(ranks) != 8:
+            raise ValueError(f'invalid FEN placement: {placement}')
+        board = position.board
+        pieces = position.pieces
+        for i, rank in enumerate(ranks):
+            sq = (7 - i) * 8
+            for char in rank:
+                code = _FEN_CODES.get(char)
+                if code is None:
+                    if not char.isdigit():
+                        raise ValueError(f'invalid FEN piece: {char}')
+                    sq += int(char)
+                    continue
+                if sq >= 64:
+                    raise ValueError(f'invalid FEN placement: {placement}')
+                # the key is computed once at the end, so skip put()
+                board[sq] = code
+                pieces[code >= 6][code % 6] |= 1 << sq
+                sq += 1
+        for color in (WHITE, BLACK):
+            own = pieces[color]
+            position.occupied[color] = own[0] | own[1] | own[2] | own[3] | own[4] | own[5]
+
+        if turn not in ('w', 'b'):
+            raise ValueError(f'invalid FEN side to move: {turn}')
+        position.turn = WHITE if turn == 'w' else BLACK
+        for char, right in (('K', WHITE_OO), ('Q', WHITE_OOO), ('k', BLACK_OO), ('q', BLACK_OOO)):
+            if char in castling:
+                position.castling |= right
+        if ep != '-':
+            if len(ep) != 2 or ep[0] not in 'abcdefgh' or ep[1] not in '36':
+                raise ValueError(f'invalid FEN en passant square: {ep}')
+            target = (int(ep[1]) - 1) * 8 + 'abcdefgh'.index(ep[0])
+            # same convention as make(): only a capturable target is kept
+            if PAWN_ATTACKS[position.turn ^ 1][target] & position.pieces[position.turn][PAWN]:
+                position.ep = target
+        try:
+            if len(fields) > 4:
+                position.halfmove = int(fields[4])
+            if len(fields) > 5:
+                position.fullmove = int(fields[5])
+        except ValueError:
+            raise ValueError(f'invalid FEN move counters: {fen}') from None
+        position.key = position.compute_key()
+        position.mg, position.eg, position.phase = full_terms(position)
+        return position
+
+    # FEN string of the position, the en-passant square only when a capture is possible
+    def to_fen(self):
+        ranks = []
+        board = self.board
+        for rank in range(7, -1, -1):
+            text = ''
+            empty = 0
+            for sq in range(rank * 8, rank * 8 + 8):
+                if board[sq] == NO_PIECE:
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                text += _FEN_CHARS[board[sq]]
+            if empty:
+                text += str(empty)
+            ranks.append(text)
+
+        castling = ''.join(char for char, right in (('K', WHITE_OO), ('Q', WHITE_OOO), ('k', BLACK_OO),
+                                                    ('q', BLACK_OOO)) if self.castling & right) or '-'
+        ep = square_name(self.ep) if self.ep >= 0 else '-'
+        return f'{"/".join(ranks)} {"wb"[self.turn]} {castling} {ep} {self.halfmove} {self.fullmove}'
+
+    # zobrist key computed from scratch, make() and unmake() keep self.key equal to it
+    def compute_key(self):
+        key = ZOBRIST_CASTLING[self.castling]
+        for sq in range(64):
+            if self.board[sq] != NO_PIECE:
+                key ^= ZOBRIST_PIECES[self.board[sq]][sq]
+        if self.ep >= 0:
+            key ^= ZOBRIST_EP[self.ep & 7]
+        if self.turn == BLACK:
+            key ^= ZOBRIST_TURN
+        return key
+
+    # checks if the current position occurred before with the same side to move
+    def is_repetition(self):
+        key = self.key
+        stack = self.stack
+        # nothing before the last capture or pawn move can repeat
+        last = max(-1, len(stack) - 1 - self.halfmove)
+        for i in range(len(stack) - 2, last, -2):
+            if stack[i][5] == key:
+                return True
+        return False
+
+    def put(self, sq, color, ptype):
+        bb = 1 << sq
+        self.pieces[color][ptype] |= bb
+        self.occupied[color] |= bb
+        code = color * 6 + ptype
+        self.board[sq] = code
+        self.key ^= ZOBRIST_PIECES[code][sq]
+        self.mg += MG_TABLE[code][sq]
+        self.eg += EG_TABLE[code][sq]
+        self.phase += PHASE_TABLE[code]
+
+    def remove(self, sq):
+        code = self.board[sq]
+        if code == NO_PIECE:
+            return
+        color, ptype = divmod(code, 6)
+        bb = 1 << sq
+        self.pieces[color][ptype] ^= bb
+        self.occupied[color] ^= bb
+        self.board[sq] = NO_PIECE
+        self.key ^= ZOBRIST_PIECES[code][sq]
+        self.mg -= MG_TABLE[code][sq]
+        self.eg -= EG_TABLE[code][sq]
+        self.phase -= PHASE_TABLE[code]
+
+    def king_square(self, color):
+        return self.pieces[color][KING].bit_length() - 1
+
+    # attack queries
+
+    # all pieces of both colors attacking sq with the given occupancy
+    def attackers_to(self, sq, occ=None):
+        '''
+        :param sq: attacked square
+        :param occ: occupancy used for sliders, the current one by default
+        :return: bitboard of attackers of both colors
+        '''
+        if occ is None:
+            occ = self.occupied[0] | self.occupied[1]
+        white, black = self.pieces
+        diagonal = white[BISHOP] | white[QUEEN] | black[BISHOP] | black[QUEEN]
+        straight = white[ROOK] | white[QUEEN] | black[ROOK] | black[QUEEN]
+        return (PAWN_ATTACKS[BLACK][sq] & white[PAWN]) \
+            | (PAWN_ATTACKS[WHITE][sq] & black[PAWN]) \
+            | (KNIGHT_ATTACKS[sq] & (white[KNIGHT] | black[KNIGHT])) \
+            | (KING_ATTACKS[sq] & (white[KING] | black[KING])) \
+            | (bishop_attacks(sq, occ) & diagonal) \
+            | (rook_attacks(sq, occ) & straight)
+
+    # checks whether color attacks sq
+    def is_attacked(self, sq, color, occ=None):
+        '''
+        :param sq: attacked square
+        :param color: attacking color
+        :param occ: occupancy used for sliders, the current one by default
+        :return: True if any piece of color attacks sq
+        '''
+        if occ is None:
+            occ = self.occupied[0] | self.occupied[1]
+        pcs = self.pieces[color]
+        if KNIGHT_ATTACKS[sq] & pcs[KNIGHT]:
+            return True
+        if PAWN_ATTACKS[color ^ 1][sq] & pcs[PAWN]:
+            return True
+        if KING_ATTACKS[sq] & pcs[KING]:
+            return True
+        diagonal = pcs[BISHOP] | pcs[QUEEN]
+        if diagonal and bishop_attacks(sq, occ) & diagonal:
+            return True
+        straight = pcs[ROOK] | pcs[QUEEN]
+        if straight and rook_attacks(sq, occ) & straight:
+            return True
+        return False
+
+    def in_check(self, color):
+        king = self.pieces[color][KING]
+        if not king:
+            return False
+        return self.is_attacked(king.bit_length() - 1, color ^ 1)
+
+    # enemy pieces giving check to the king of color
+    def checkers(self, color=None):
+        us = self.turn if color is None else color
+        king = self.pieces[us][KING]
+        if not king:
+            return 0
+        return self.attackers_to(king.bit_length() - 1) & self.occupied[us ^ 1]
+
+    # pieces of color pinned to their king
+    def pins(self, color=None):
+        '''
+        :param color: WHITE or BLACK, side to move by default
+        :return: (bitboard of pinned pieces, {pinned square: squares it may still move to})
+        '''
+        us = self.turn if color is None else color
+        them = us ^ 1
+        king = self.pieces[us][KING]
+        pinned = 0
+        rays = {}
+        if not king:
+            return pinned, rays
+        king_sq = king.bit_length() - 1
+        own = self.occupied[us]
+        enemy = self.occupied[them]
+        pcs = self.pieces[them]
+        # sliders that would attack the king through exactly one own piece
+        snipers = (bishop_attacks(king_sq, enemy) & (pcs[BISHOP] | pcs[QUEEN])) \
+            | (rook_attacks(king_sq, enemy) & (pcs[ROOK] | pcs[QUEEN]))
+        while snipers:
+            lsb = snipers & -snipers
+            snipers ^= lsb
+            sniper = lsb.bit_length() - 1
+            between = BETWEEN[king_sq][sniper]
+            blockers = between & own
+            if blockers and not blockers & (blockers - 1) and not between & enemy:
+                pinned |= blockers
+                rays[blockers.bit_length() - 1] = between | lsb
+        return pinned, rays
+
+    # makes a move, unmake() takes it back
+    def make(self, move):
+        frm = move & 63
+        to = (move >> 6) & 63
+        promo = (move >> 12) & 7
+        board = self.board
+        code = board[frm]
+        us, ptype = divmod(code, 6)
+        them = us ^ 1
+        captured = board[to]
+        key = self.key
+        mg = self.mg
+        eg = self.eg
+        self.stack.append((move, captured, self.castling, self.ep, self.turn, key, self.halfmove, mg, eg, self.phase))
+        if captured != NO_PIECE or ptype == PAWN:
+            self.halfmove = 0
+        else:
+            self.halfmove += 1
+        if us == BLACK:
+            self.fullmove += 1
+
+        own = self.pieces[us]
+        from_to = (1 << frm) | (1 << to)
+
+        # captured piece
+        if captured != NO_PIECE:
+            bb = 1 << to
+            self.pieces[them][captured - 6 * them] ^= bb
+            self.occupied[them] ^= bb
+            key ^= ZOBRIST_PIECES[captured][to]
+            mg -= MG_TABLE[captured][to]
+            eg -= EG_TABLE[captured][to]
+            self.phase -= PHASE_TABLE[captured]
+
+        # moving piece
+        own[ptype] ^= from_to
+        self.occupied[us] ^= from_to
+        board[frm] = NO_PIECE
+        board[to] = code
+        key ^= ZOBRIST_PIECES[code][frm] ^ ZOBRIST_PIECES[code][to]
+        table = MG_TABLE[code]
+        mg += table[to] - table[frm]
+        table = EG_TABLE[code]
+        eg += table[to] - table[frm]
+
+        ep = self.ep
+        if ep >= 0:
+            key ^= ZOBRIST_EP[ep & 7]
+        self.ep = -1
+        if ptype == PAWN:
+            if move & FLAG_EN_PASSANT:
+                # en passant capture takes the pawn behind the target square
+                victim = to - 8 if us == WHITE else to + 8
+                bb = 1 << victim
+                self.pieces[them][PAWN] ^= bb
+                self.occupied[them] ^= bb
+                board[victim] = NO_PIECE
+                key ^= ZOBRIST_PIECES[them * 6 + PAWN][victim]
+                mg -= MG_TABLE[them * 6 + PAWN][victim]
+                eg -= EG_TABLE[them * 6 + PAWN][victim]
+            elif to - frm == 16 or frm - to == 16:
+                target = (frm + to) >> 1
+                # only remember a target an enemy pawn can actually capture on
+                if PAWN_ATTACKS[us][target] & self.pieces[them][PAWN]:
+                    self.ep = target
+                    key ^= ZOBRIST_EP[target & 7]
+            elif promo:
+                bb = 1 << to
+                own[PAWN] ^= bb
+                own[promo] |= bb
+                board[to] = us * 6 + promo
+                key ^= ZOBRIST_PIECES[code][to] ^ ZOBRIST_PIECES[us * 6 + promo][to]
+                mg += MG_TABLE[us * 6 + promo][to] - MG_TABLE[code][to]
+                eg += EG_TABLE[us * 6 + promo][to] - EG_TABLE[code][to]
+                self.phase += PHASE_TABLE[us * 6 + promo]
+        elif move & FLAG_CASTLE:
+            # castling moves the rook as well
+            rook_from, rook_to = (frm + 3, frm + 1) if to > frm else (frm - 4, frm - 1)
+            rook_bb = (1 << rook_from) | (1 << rook_to)
+            own[ROOK] ^= rook_bb
+            self.occupied[us] ^= rook_bb
+            board[rook_from] = NO_PIECE
+            board[rook_to] = us * 6 + ROOK
+            key ^= ZOBRIST_PIECES[us * 6 + ROOK][rook_from] ^ ZOBRIST_PIECES[us * 6 + ROOK][rook_to]
+            table = MG_TABLE[us * 6 + ROOK]
+            mg += table[rook_to] - table[rook_from]
+            table = EG_TABLE[us * 6 + ROOK]
+            eg += table[rook_to] - table[rook_from]
+
+        castling = self.castling & _CASTLE_KEEP[frm] & _CASTLE_KEEP[to]
+        key ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_CASTLING[castling]
+        self.castling = castling
+        self.turn = them
+        self.key = key ^ ZOBRIST_TURN
+        self.mg = mg
+        self.eg = eg
+
+    def unmake(self):
+        move, captured, self.castling, self.ep, self.turn, self.key, self.halfmove, self.mg, self.eg, self.phase = \
+            self.stack.pop()
+        if self.turn == BLACK:
+            self.fullmove -= 1
+        frm = move & 63
+        to = (move >> 6) & 63
+        promo = (move >> 12) & 7
+        board = self.board
+        code = board[to]
+        us, ptype = divmod(code, 6)
+        them = us ^ 1
+        own = self.pieces[us]
+
+        if promo:
+            # the promoted piece may have been replaced since, so take it from the mailbox
+            bb = 1 << to
+            own[ptype] ^= bb
+            own[PAWN] |= bb
+            ptype = PAWN
+            code = us * 6 + PAWN
+
+        from_to = (1 << frm) | (1 << to)
+        own[ptype] ^= from_to
+        self.occupied[us] ^= from_to
+        board[frm] = code
+        board[to] = captured
+
+        if captured != NO_PIECE:
+            bb = 1 << to
+            self.pieces[them][captured - 6 * them] |= bb
+            self.occupied[them] |= bb
+        elif move & FLAG_EN_PASSANT:
+            victim = to - 8 if us == WHITE else to + 8
+            bb = 1 << victim
+            self.pieces[them][PAWN] |= bb
+            self.occupied[them] |= bb
+            board[victim] = them * 6 + PAWN
+        elif move & FLAG_CASTLE:
+            rook_from, rook_to = (frm + 3, frm + 1) if to > frm else (frm - 4, frm - 1)
+            rook_bb = (1 << rook_from) | (1 << rook_to)
+            own[ROOK] ^= rook_bb
+            self.occupied[us] ^= rook_bb
+            board[rook_to] = NO_PIECE
+            board[rook_from] = us * 6 + ROOK
+
+    # generates pseudo-legal moves of color, only for pieces on from_mask
+    def pseudo_legal_moves(self, color=None, from_mask=FULL, moves=None, gen=GEN_ALL):
+        '''
+        :param color: WHITE or BLACK, side to move by default
+        :param from_mask: bitboard of squares whose pieces are generated
+        :param moves: list to fill instead of a new one, e.g. a buffer kept per search ply
+        :param gen: GEN_CAPTURES for captures and promotions, GEN_QUIETS for the rest, GEN_ALL for both
+        :return: list of encoded moves with their capture, en passant and castling flags
+        '''
+        us = self.turn if color is None else color
+        them = us ^ 1
+        own = self.occupied[us]
+        enemy = self.occupied[them]
+        occ = own | enemy
+        empty = ~occ & FULL
+        # target squares of the requested stage
+        capture_mask = enemy if gen & GEN_CAPTURES else 0
+        quiet_mask = empty if gen & GEN_QUIETS else 0
+        pcs = self.pieces[us]
+        if moves is None:
+            moves = []
+        else:
+            moves.clear()
+        append = moves.append
+
+        # pawns
+        pawns = pcs[PAWN] & from_mask
+        if pawns:
+            if us == WHITE:
+                single = (pawns << 8) & empty
+                double = ((single & RANK_3) << 8) & empty
+                push = 8
+                last_rank = RANK_8
+            else:
+                single = (pawns >> 8) & empty
+                double = ((single & RANK_6) >> 8) & empty
+                push = -8
+                last_rank = RANK_1
+            # promotions belong to the captures stage
+            if not gen & GEN_QUIETS:
+                single &= last_rank
+                double = 0
+            if not gen & GEN_CAPTURES:
+                single &= ~last_rank
+            bb = single
+            while bb:
+                lsb = bb & -bb
+                to = lsb.bit_length() - 1
+                bb ^= lsb
+                frm = to - push
+                if lsb & last_rank:
+                    base = frm | (to << 6)
+                    append(base | (QUEEN << 12))
+                    append(base | (KNIGHT << 12))
+                    append(base | (ROOK << 12))
+                    append(base | (BISHOP << 12))
+                else:
+                    append(frm | (to << 6))
+            bb = double
+            while bb:
+                lsb = bb & -bb
+                to = lsb.bit_length() - 1
+                bb ^= lsb
+                append((to - 2 * push) | (to << 6))
+            ep_bb = (1 << self.ep) if self.ep >= 0 else 0
+            attacks = PAWN_ATTACKS[us]
+            bb = pawns if gen & GEN_CAPTURES else 0
+            while bb:
+                lsb = bb & -bb
+                frm = lsb.bit_length() - 1
+                bb ^= lsb
+                caps = attacks[frm] & enemy
+                while caps:
+                    to_bb = caps & -caps
+                    to = to_bb.bit_length() - 1
+                    caps ^= to_bb
+                    base = frm | (to << 6) | FLAG_CAPTURE
+                    if to_bb & last_rank:
+                        append(base | (QUEEN << 12))
+                        append(base | (KNIGHT << 12))
+                        append(base | (ROOK << 12))
+                        append(base | (BISHOP << 12))
+                    else:
+                        append(base)
+                if attacks[frm] & ep_bb:
+                    append(frm | (self.ep << 6) | FLAG_CAPTURE | FLAG_EN_PASSANT)
+
+        # knights
+        bb = pcs[KNIGHT] & from_mask
+        while bb:
+            lsb = bb & -bb
+            frm = lsb.bit_length() - 1
+            bb ^= lsb
+            dest = KNIGHT_ATTACKS[frm]
+            caps = dest & capture_mask
+            while caps:
+                to_bb = caps & -caps
+                caps ^= to_bb
+                append(frm | ((to_bb.bit_length() - 1) << 6) | FLAG_CAPTURE)
+            dest &= quiet_mask
+            while dest:
+                to_bb = dest & -dest
+                dest ^= to_bb
+                append(frm | ((to_bb.bit_length() - 1) << 6))
+
+        # bishops, rooks and queens
+        for ptype, attack in ((BISHOP, bishop_attacks), (ROOK, rook_attacks), (QUEEN, queen_attacks)):
+            bb = pcs[ptype] & from_mask
+            while bb:
+                lsb = bb & -bb
+                frm = lsb.bit_length() - 1
+                bb ^= lsb
+                dest = attack(frm, occ)
+                caps = dest & capture_mask
+                while caps:
+                    to_bb = caps & -caps
+                    caps ^= to_bb
+                    append(frm | ((to_bb.bit_length() - 1) << 6) | FLAG_CAPTURE)
+                dest &= quiet_mask
+                while dest:
+                    to_bb = dest & -dest
+                    dest ^= to_bb
+                    append(frm | ((to_bb.bit_length() - 1) << 6))
+
+        # king
+        bb = pcs[KING] & from_mask
+        if bb:
+            frm = bb.bit_length() - 1
+            dest = KING_ATTACKS[frm]
+            caps = dest & capture_mask
+            while caps:
+                to_bb = caps & -caps
+                caps ^= to_bb
+                append(frm | ((to_bb.bit_length() - 1) << 6) | FLAG_CAPTURE)
+            dest &= quiet_mask
+            while dest:
+                to_bb = dest & -dest
+                dest ^= to_bb
+                append(frm | ((to_bb.bit_length() - 1) << 6))
+
+            # castling: rights, empty path, king not crossing attacked squares
+            oo, ooo, home = (WHITE_OO, WHITE_OOO, 4) if us == WHITE else (BLACK_OO, BLACK_OOO, 60)
+            if gen & GEN_QUIETS and frm == home and self.castling & (oo | ooo) \
+                    and not self.is_attacked(home, them, occ):
+                if self.castling & oo and not occ & (0x60 << (home - 4)) \
+                        and not self.is_attacked(home + 1, them, occ) and not self.is_attacked(home + 2, them, occ):
+                    append(home | ((home + 2) << 6) | FLAG_CASTLE)
+                if self.castling & ooo and not occ & (0x0E << (home - 4)) \
+                        and not self.is_attacked(home - 1, them, occ) and not self.is_attacked(home - 2, them, occ):
+                    append(home | ((home - 2) << 6) | FLAG_CASTLE)
+
+        return moves
+
+    # generates legal moves of color, only for pieces on from_mask
+    def legal_moves(self, color=None, from_mask=FULL, moves=None, gen=GEN_ALL):
+        '''
+        Pseudo-legal moves are filtered with checkers and pins instead of
+        making every move, only en passant captures are tried on the board.
+        :param color: WHITE or BLACK, side to move by default
+        :param from_mask: bitboard of squares whose pieces are generated
+        :param moves: list to fill instead of a new one, e.g. a buffer kept per search ply
+        :param gen: GEN_CAPTURES for captures and promotions, GEN_QUIETS for the rest, GEN_ALL for both
+        :return: list of encoded moves that don't leave own king in check
+        '''
+        us = self.turn if color is None else color
+        them = us ^ 1
+        king = self.pieces[us][KING]
+        if not king:
+            return self.pseudo_legal_moves(us, from_mask, moves, gen)
+        king_sq = king.bit_length() - 1
+        occ = self.occupied[0] | self.occupied[1]
+
+        checkers = self.checkers(us)
+        if checkers & (checkers - 1):
+            # double check, only the king can move
+            from_mask &= king
+            evasion = FULL
+        elif checkers:
+            # capture the checker or block its ray
+            evasion = checkers | BETWEEN[king_sq][checkers.bit_length() - 1]
+        else:
+            evasion = FULL
+        pinned, pin_rays = self.pins(us)
+
+        # legal moves are compacted to the front of the generated list
+        moves = self.pseudo_legal_moves(us, from_mask, moves, gen)
+        count = 0
+        for move in moves:
+            frm = move & 63
+            to = (move >> 6) & 63
+            if frm == king_sq:
+                # castling was checked by the generator, other steps must not end attacked
+                if move & FLAG_CASTLE or not self.is_attacked(to, them, occ ^ king):
+                    moves[count] = move
+                    count += 1
+            elif move & FLAG_EN_PASSANT:
+                # en passant removes two pieces from a line, test it on the board
+                self.make(move)
+                if not self.in_check(us):
+                    moves[count] = move
+                    count += 1
+                self.unmake()
+            elif (evasion >> to) & 1 and (not (pinned >> frm) & 1 or (pin_rays[frm] >> to) & 1):
+                moves[count] = move
+                count += 1
+        del moves[count:]
+        return moves
+
+    # legal move from squares and promotion, with its flags filled in
+    def encode(self, frm, to, promo=0):
+        '''
+        :return: encoded move as the generators produce it, not checked for legality
+        '''
+        flags = 0
+        ptype = self.board[frm] % 6
+        if self.board[to] != NO_PIECE:
+            flags = FLAG_CAPTURE
+        elif ptype == PAWN and to == self.ep:
+            flags = FLAG_CAPTURE | FLAG_EN_PASSANT
+        elif ptype == KING and (to - frm == 2 or frm - to == 2):
+            flags = FLAG_CASTLE
+        return frm | (to << 6) | (promo << 12) | flags
+
+    # checks if color has at least one legal move
+    def has_legal_move(self, color=None):
+        return len(self.legal_moves(color)) > 0
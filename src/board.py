@@ -2,23 +2,89 @@ from const import *
 from square import Square
 from piece import *
 from move import Move
-from sound import Sound
-import copy
-import os
+from undo import Undo
+from movecache import MoveCache
+from pgn import move_to_san, san_to_move
+import evaluation
+from bitboard import Position, BLACK, COLOR_INDEX, COLOR_NAMES, PIECE_INDEX, PIECE_NAMES, PAWN, WHITE_OO, WHITE_OOO, \
+    BLACK_OO, BLACK_OOO, square_index, row_col, move_from, move_to, move_promo
 
 
 class Board:
 
-    def __init__(self):
+    def __init__(self, fen=None):
+        '''
+        :param fen: position to set up, the start position by default
+        '''
         # checkmate and stalemate
         self.checkmate = False
         self.stalemate = False
 
-        self.squares = [[Square(row, col) for col in range(COLS)] for row in range(ROWS)]
         self.last_move = None
-        self._create()
-        self._add_pieces('white')
-        self._add_pieces('black')
+        # pawn that can be captured en passant and undo records of made moves
+        self.en_passant_pawn = None
+        self.undo_stack = []
+        # encoded moves found by calc_moves, for constant time valid_move checks
+        self.valid_codes = set()
+        # legal moves by position, shared by calc_moves, moves_left and the engine
+        self.move_cache = MoveCache()
+        # callables notified with the undo record of every move made with self.move()
+        self.observers = []
+        if fen is None:
+            self.squares = [[Square(row, col) for col in range(COLS)] for row in range(ROWS)]
+            self._create()
+            self._add_pieces('white')
+            self._add_pieces('black')
+            # bitboards kept in sync with squares, used for move generation
+            self.position = self._create_position()
+        else:
+            # squares and pieces are only built once something asks for them,
+            # so batch jobs that only need the position stay cheap
+            self.position = Position.from_fen(fen)
+            self._squares = None
+
+    # sets up a board from a FEN string
+    @classmethod
+    def from_fen(cls, fen):
+        '''
+        :param fen: FEN string, move counters are optional
+        :return: new Board, raises ValueError on an invalid FEN
+        '''
+        return cls(fen)
+
+    # sets the board up again from a FEN string, observers and the move cache are kept
+    def set_fen(self, fen):
+        '''
+        :param fen: FEN string, raises ValueError if it is invalid
+        '''
+        self.position = Position.from_fen(fen)
+        self._squares = None
+        self.last_move = None
+        self.en_passant_pawn = None
+        self.undo_stack = []
+        self.valid_codes.clear()
+        self.checkmate = False
+        self.stalemate = False
+
+    # FEN string of the current position
+    def to_fen(self) -> str:
+        return self.position.to_fen()
+
+    # side to move, 'white' or 'black'
+    @property
+    def turn(self) -> str:
+        return COLOR_NAMES[self.position.turn]
+
+    # squares with their pieces, built from the position on first use
+    @property
+    def squares(self):
+        if self._squares is None:
+            self._squares = self._create_squares()
+        return self._squares
+
+    @squares.setter
+    def squares(self, squares):
+        self._squares = squares
 
     # makes a move and remembers last move made
     def move(self, piece: Piece, move: Move, testing=False):
@@ -27,72 +93,172 @@ class Board:
         :param piece: piece being moved
         :param move: Move that is being done
         :param testing:
-        :return: return all changed squares
+        :return: undo record of the move
         '''
+        undo = self.make_move(move)
+
+        # clear valid moves
+        self.clear_moves()
 
-        changed_squares = []
+        # sounds, logs and other observers, not needed while testing moves
+        if not testing:
+            for observer in self.observers:
+                observer(undo)
 
+        return undo
+
+    # registers a callable that receives the undo record of every played move
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
+
+    # makes a move in place, unmake_move() takes it back
+    def make_move(self, move: Move) -> Undo:
+        '''
+        :param move: any valid move
+        :return: undo record, also kept on the board's undo stack
+        '''
         initial = move.initial
         final = move.final
+        square_from = self.squares[initial.row][initial.col]
+        square_to = self.squares[final.row][final.col]
+        piece = square_from.piece
 
-        en_passant_empty = self.squares[final.row][final.col].is_empty()
+        undo = Undo(move, piece, piece.moved, self.last_move, self.en_passant_pawn)
 
-        # write changed squares
-        changed_squares.append(copy.deepcopy(self.squares[initial.row][initial.col]))
-        changed_squares.append(copy.deepcopy(self.squares[final.row][final.col]))
+        # bitboard move update
+        self.position.make(self.move_code(move))
+
+        # captured piece, en passant captures the pawn beside the initial square
+        undo.captured = square_to.piece
+        undo.captured_row, undo.captured_col = final.row, final.col
+        if isinstance(piece, Pawn) and initial.col != final.col and square_to.is_empty():
+            undo.captured = self.squares[initial.row][final.col].piece
+            undo.captured_row = initial.row
+            self.squares[initial.row][final.col].piece = None
 
         # console board move update
-        self.squares[initial.row][initial.col].piece = None
-        self.squares[final.row][final.col].piece = piece
+        square_from.piece = None
+        square_to.piece = piece
 
-        # making en-passant move if possible
         if isinstance(piece, Pawn):
-            # en passant capture
+            # promotion, a queen unless another piece was chosen
+            if final.row == 0 or final.row == 7:
+                promoted = PIECE_CLASSES[move.promotion or 'queen'](piece.color)
+                promoted.moved = True
+                square_to.piece = promoted
+
+        # castling moves the rook as well
+        if isinstance(piece, King) and self.castling(initial, final):
             diff = final.col - initial.col
-            if diff != 0 and en_passant_empty:
-                # write changed squares
-                if not testing:
-                    changed_squares.append(copy.deepcopy(self.squares[initial.row][initial.col + diff]))
-                # console board move update
-                self.squares[initial.row][initial.col + diff].piece = None
-                self.squares[final.row][final.col].piece = piece
-                if not testing:
-                    sound = Sound(
-                        os.path.join('../assets/sounds/capture.wav'))
-                    sound.play()
-
-        # castling if possible
-        if isinstance(piece, King):
-            if self.castling(initial, final) and not testing:
-                diff = final.col - initial.col
-                rook = piece.left_rook if (diff < 0) else piece.right_rook
-                # write changed squares
-                c = 0 if diff < 0 else 7
-                changed_squares.append(copy.deepcopy(self.squares[initial.row][c]))
-                changed_squares.append(copy.deepcopy(self.squares[initial.row][final.col - abs(diff) // diff]))
-
-                self.move(rook, rook.moves[-1])
+            undo.rook_from = 0 if diff < 0 else 7
+            undo.rook_to = final.col - abs(diff) // diff
+            undo.rook = self.squares[initial.row][undo.rook_from].piece
+            undo.rook_moved = undo.rook.moved
+            self.squares[initial.row][undo.rook_from].piece = None
+            self.squares[initial.row][undo.rook_to].piece = undo.rook
+            undo.rook.moved = True
+
+        # only a pawn that just made a double step can be taken en passant
+        if self.en_passant_pawn is not None:
+            self.en_passant_pawn.en_passant = False
+            self.en_passant_pawn = None
+        if isinstance(piece, Pawn) and abs(final.row - initial.row) == 2:
+            piece.en_passant = True
+            self.en_passant_pawn = piece
 
         # move
         piece.moved = True
 
-        # clear valid moves
-        self.clear_moves()
-
         # set last move
         self.last_move = move
 
-        return changed_squares
+        self.undo_stack.append(undo)
+        return undo
 
-    # makes last move backwards
-    def undo_move(self, fields):
+    # takes back the last move made with make_move()
+    def unmake_move(self) -> Undo:
         '''
-        undoes last move
-        :param fields: get all changed fields and return their pieces back
+        :return: undo record of the move taken back
+        '''
+        undo = self.undo_stack.pop()
+        initial = undo.move.initial
+        final = undo.move.final
+
+        self.position.unmake()
+
+        # console board move update
+        self.squares[final.row][final.col].piece = None
+        self.squares[initial.row][initial.col].piece = undo.piece
+        if undo.captured is not None:
+            self.squares[undo.captured_row][undo.captured_col].piece = undo.captured
+
+        if undo.rook is not None:
+            self.squares[initial.row][undo.rook_to].piece = None
+            self.squares[initial.row][undo.rook_from].piece = undo.rook
+            undo.rook.moved = undo.rook_moved
+
+        if self.en_passant_pawn is not None:
+            self.en_passant_pawn.en_passant = False
+        self.en_passant_pawn = undo.en_passant_pawn
+        if self.en_passant_pawn is not None:
+            self.en_passant_pawn.en_passant = True
+
+        undo.piece.moved = undo.moved
+        self.last_move = undo.last_move
+        return undo
+
+    # changes the piece a pawn has been promoted to
+    def promote(self, row, col, piece: Piece):
+        '''
+        :param row: row of the promoted pawn
+        :param col: col of the promoted pawn
+        :param piece: new piece
         :return: None
         '''
-        for field in fields:
-            self.squares[field.row][field.col].piece = field.piece
+        piece.moved = True
+        self.squares[row][col].piece = piece
+        if self.last_move is not None:
+            self.last_move.promotion = piece.name
+        sq = square_index(row, col)
+        self.position.remove(sq)
+        self.position.put(sq, COLOR_INDEX[piece.color], PIECE_INDEX[piece.name])
+        # the recorded move promotes to the chosen piece, so the game replays right
+        stack = self.position.stack
+        if stack and move_to(stack[-1][0]) == sq and move_promo(stack[-1][0]):
+            stack[-1] = (stack[-1][0] & ~(7 << 12) | PIECE_INDEX[piece.name] << 12,) + stack[-1][1:]
+
+    # encodes a Move for the bitboard position, flags included
+    def move_code(self, move: Move) -> int:
+        initial = move.initial
+        final = move.final
+        frm = square_index(initial.row, initial.col)
+        to = square_index(final.row, final.col)
+        promo = 0
+        if self.position.board[frm] % 6 == PAWN and (final.row == 0 or final.row == 7):
+            promo = PIECE_INDEX[move.promotion or 'queen']
+        return self.position.encode(frm, to, promo)
+
+    # decodes a bitboard move into a Move, the only place moves become objects
+    def code_to_move(self, code: int) -> Move:
+        promo = move_promo(code)
+        return Move(Square(*row_col(move_from(code))), Square(*row_col(move_to(code))),
+                    PIECE_NAMES[promo] if promo else None)
+
+    # SAN of a valid move in the current position, e.g. Nf3
+    def to_san(self, move: Move) -> str:
+        return move_to_san(self.position, self.move_code(move))
+
+    # Move of a SAN string in the current position, raises ValueError if it is not legal
+    def from_san(self, san: str) -> Move:
+        return self.code_to_move(san_to_move(self.position, san))
+
+    # zobrist key of the current position, read in O(1)
+    @property
+    def key(self) -> int:
+        return self.position.key
 
     # checks if the move is valid or not
     def valid_move(self, piece: Piece, move: Move):
@@ -101,7 +267,8 @@ class Board:
         :param move: any move
         :return: True if piece can do the move, else False
         '''
-        return move in piece.moves
+        # a set lookup of the codes found by calc_moves
+        return self.move_code(move) in self.valid_codes
 
     # checks if promotion is happening
     def check_promotion(self, piece: Piece, final: Square):
@@ -121,15 +288,18 @@ class Board:
         :param color: black or white
         :return: True if this color's pieces can move
         '''
-        for row in range(ROWS):
-            for col in range(COLS):
-                if self.squares[row][col].has_enemy_piece(color):
-                    p = self.squares[row][col].piece
-                    self.calc_moves(p, row, col, check=True)
-                    if len(p.moves) > 0:
-                        return True
-                    p.clear_moves()
-        return False
+        return bool(self.legal_codes(COLOR_INDEX[color] ^ 1))
+
+    # encoded legal moves of a color, from the move cache when it is the side to move
+    def legal_codes(self, color=None):
+        '''
+        :param color: WHITE or BLACK, side to move by default
+        :return: tuple or list of encoded moves, not to be changed
+        '''
+        position = self.position
+        if color is None or color == position.turn:
+            return self.move_cache.legal_moves(position)
+        return position.legal_moves(color)
 
     # checks if castling is valid in self.move()
     def valid_castling(self, king_move: Move, piece: Piece):
@@ -141,8 +311,9 @@ class Board:
         row = king_move.initial.row
         start = min(king_move.initial.col, king_move.final.col)
         end = max(king_move.initial.col, king_move.final.col)
+        enemy = COLOR_INDEX[piece.color] ^ 1
         for col in range(start, end + 1):
-            if self.square_under_attack(self.squares[row][col], piece):
+            if self.position.is_attacked(square_index(row, col), enemy):
                 return False
         return True
 
@@ -150,19 +321,7 @@ class Board:
     def castling(self, initial: Square, final: Square):
         return abs(initial.col - final.col) == 2
 
-    def set_true_en_passant(self, piece: Piece):
-
-        if not isinstance(piece, Pawn):
-            return
-
-        for row in range(ROWS):
-            for col in range(COLS):
-                if isinstance(self.squares[row][col].piece, Pawn):
-                    self.squares[row][col].piece.en_passant = False
-
-        piece.en_passant = True
-
-    # checks whether piece.color king is checked after a move, needed in calc_moves with checks
+    # checks whether piece.color king is checked after a move
     def in_check(self, piece: Piece, move: Move):
         '''
 
@@ -170,20 +329,10 @@ class Board:
         :param move: any valid move
         :return: if a king is in check after a move
         '''
-        temp_piece = copy.deepcopy(piece)
-        temp_board = copy.deepcopy(self)
-        temp_board.move(temp_piece, move, testing=True)
-
-        for row in range(ROWS):
-            for col in range(COLS):
-                if temp_board.squares[row][col].has_enemy_piece(piece.color):
-                    p = temp_board.squares[row][col].piece
-                    temp_board.calc_moves(p, row, col, check=False)
-                    for m in p.moves:
-                        if isinstance(m.final.piece, King):
-                            return True
-
-        return False
+        self.position.make(self.move_code(move))
+        checked = self.position.in_check(COLOR_INDEX[piece.color])
+        self.position.unmake()
+        return checked
 
     # checks if king is checked for mate or stalemate
     def king_checked(self, color):
@@ -192,34 +341,15 @@ class Board:
         :param color: white or black
         :return: True if king of given color is checked else False
         '''
-        for row in range(ROWS):
-            for col in range(COLS):
-                if self.squares[row][col].has_enemy_piece(color):
-                    p = self.squares[row][col].piece
-                    self.calc_moves(p, row, col, check=False)
-                    for m in p.moves:
-                        if isinstance(m.final.piece, King):
-                            p.clear_moves()
-                            return True
-                    p.clear_moves()
-        return False
+        return self.position.in_check(COLOR_INDEX[color])
 
     # checks whether the square is attacked, needed for checking castling validity
     def square_under_attack(self, square: Square, piece: Piece):
-        temp_board = copy.deepcopy(self)
-        for row in range(ROWS):
-            for col in range(COLS):
-                if temp_board.squares[row][col].has_enemy_piece(piece.color):
-                    p = temp_board.squares[row][col].piece
-                    temp_board.calc_moves(p, row, col, check=False)
-                    for m in p.moves:
-                        if m.final == square:
-                            return True
-
-        return False
+        return self.position.is_attacked(square_index(square.row, square.col), COLOR_INDEX[piece.color] ^ 1)
 
     # clears possible moves for all pieces
     def clear_moves(self):
+        self.valid_codes.clear()
         for row in range(ROWS):
             for col in range(COLS):
                 if self.squares[row][col].has_piece():
@@ -230,308 +360,76 @@ class Board:
         '''
             Calculate all the possible (valid) moves of an specific piece on a specific position
         '''
-
-        # identifies pawn's possible/valid moves
-        def pawn_moves():
-            # steps
-            steps = 1 if piece.moved else 2
-
-            # vertical moves
-            start = row + piece.dir
-            end = row + (piece.dir * (1 + steps))
-            for possible_move_row in range(start, end, piece.dir):
-                if Square.in_range(possible_move_row):
-                    if self.squares[possible_move_row][col].is_empty():
-                        # create initial and final move squares
-                        initial = Square(row, col)
-                        final = Square(possible_move_row, col)
-                        # create a new move
-                        move = Move(initial, final)
-
-                        # check potential checks
-                        if check:
-                            if not self.in_check(piece, move):
-                                # append new move
-                                piece.add_move(move)
-                        else:
-                            # append new move
-                            piece.add_move(move)
-                    # blocked
-                    else:
-                        break
-                # not in range
-                else:
-                    break
-
-            # diagonal moves
-            possible_move_row = row + piece.dir
-            possible_move_cols = [col - 1, col + 1]
-            for possible_move_col in possible_move_cols:
-                if Square.in_range(possible_move_row, possible_move_col):
-                    if self.squares[possible_move_row][possible_move_col].has_enemy_piece(piece.color):
-                        # create initial and final move squares
-                        initial = Square(row, col)
-                        final_piece = self.squares[possible_move_row][possible_move_col].piece
-                        final = Square(possible_move_row, possible_move_col, final_piece)
-                        # create a new move
-                        move = Move(initial, final)
-
-                        # check potential checks
-                        if check:
-                            if not self.in_check(piece, move):
-                                # append new move
-                                piece.add_move(move)
-                        else:
-                            # append new move
-                            piece.add_move(move)
-
-            # en passant moves
-            r = 3 if piece.color == 'white' else 4
-            fr = 2 if piece.color == 'white' else 5
-            # left en passant
-            if Square.in_range(col - 1) and row == r:
-                if self.squares[row][col - 1].has_enemy_piece(piece.color):
-                    p = self.squares[row][col - 1].piece
-                    if isinstance(p, Pawn):
-                        if p.en_passant:
-                            # create initial and final move squares
-                            initial = Square(row, col)
-                            final = Square(fr, col - 1, p)
-                            # create a new move
-                            move = Move(initial, final)
-
-                            # check potential checks
-                            if check:
-                                if not self.in_check(piece, move):
-                                    # append new move
-                                    piece.add_move(move)
-                            else:
-                                # append new move
-                                piece.add_move(move)
-
-            # right en passant
-            if Square.in_range(col + 1) and row == r:
-                if self.squares[row][col + 1].has_enemy_piece(piece.color):
-                    p = self.squares[row][col + 1].piece
-                    if isinstance(p, Pawn):
-                        if p.en_passant:
-                            # create initial and final move squares
-                            initial = Square(row, col)
-                            final = Square(fr, col + 1, p)
-                            # create a new move
-                            move = Move(initial, final)
-
-                            # check potential checks
-                            if check:
-                                if not self.in_check(piece, move):
-                                    # append new move
-                                    piece.add_move(move)
-                            else:
-                                # append new move
-                                piece.add_move(move)
-
-        # identifies knight's possible/valid moves
-        def knight_moves():
-            # 8 possible moves
-            possible_moves = [
-                (row - 2, col + 1),
-                (row - 1, col + 2),
-                (row + 1, col + 2),
-                (row + 2, col + 1),
-                (row + 2, col - 1),
-                (row + 1, col - 2),
-                (row - 1, col - 2),
-                (row - 2, col - 1),
-            ]
-
-            for possible_move in possible_moves:
-                possible_move_row, possible_move_col = possible_move
-
-                if Square.in_range(possible_move_row, possible_move_col):
-                    if self.squares[possible_move_row][possible_move_col].is_empty_or_enemy(piece.color):
-                        # create squares of the new move
-                        initial = Square(row, col)
-                        final_piece = self.squares[possible_move_row][possible_move_col].piece
-                        final = Square(possible_move_row, possible_move_col, final_piece)
-                        # create new move
-                        move = Move(initial, final)
-
-                        # check potential checks
-                        if check:
-                            if not self.in_check(piece, move):
-                                # append new move
-                                piece.add_move(move)
-                        else:
-                            # append new move
-                            piece.add_move(move)
-
-        # identifies linear possible/valid moves, used for queens, bishops and rooks
-        def straight_line_moves(incrs):
-            for incr in incrs:
-                row_incr, col_incr = incr
-                possible_move_row = row + row_incr
-                possible_move_col = col + col_incr
-
-                while True:
-                    if Square.in_range(possible_move_row, possible_move_col):
-                        # create squares of the possible new move
-                        initial = Square(row, col)
-                        final_piece = self.squares[possible_move_row][possible_move_col].piece
-                        final = Square(possible_move_row, possible_move_col, final_piece)
-                        # create a possible new move
-                        move = Move(initial, final)
-
-                        # empty = continue looping
-                        if self.squares[possible_move_row][possible_move_col].is_empty():
-                            # check potential checks
-                            if check:
-                                if not self.in_check(piece, move):
-                                    # append new move
-                                    piece.add_move(move)
-                            else:
-                                # append new move
-                                piece.add_move(move)
-
-                        # has enemy piece = add move + break
-                        elif self.squares[possible_move_row][possible_move_col].has_enemy_piece(piece.color):
-                            # check potential checks
-                            if check:
-                                if not self.in_check(piece, move):
-                                    # append new move
-                                    piece.add_move(move)
-                            else:
-                                # append new move
-                                piece.add_move(move)
-                            break
-
-                        # has team piece = break
-                        elif self.squares[possible_move_row][possible_move_col].has_team_piece(piece.color):
-                            break
-
-                    # not in range
-                    else:
-                        break
-
-                    # incrementing incrs
-                    possible_move_row = possible_move_row + row_incr
-                    possible_move_col = possible_move_col + col_incr
-
-        # identifies king's possible/valid moves
-        def king_moves():
-            adjs = [
-                (row - 1, col + 0),  # up
-                (row - 1, col + 1),  # up-right
-                (row + 0, col + 1),  # right
-                (row + 1, col + 1),  # down-right
-                (row + 1, col + 0),  # down
-                (row + 1, col - 1),  # down-left
-                (row + 0, col - 1),  # left
-                (row - 1, col - 1),  # up-left
-            ]
-
-            # normal moves
-            for possible_move in adjs:
-                possible_move_row, possible_move_col = possible_move
-
-                if Square.in_range(possible_move_row, possible_move_col):
-                    if self.squares[possible_move_row][possible_move_col].is_empty_or_enemy(piece.color):
-                        # create squares of the new move
-                        initial = Square(row, col)
-                        final = Square(possible_move_row, possible_move_col)  # piece=piece
-                        # create new move
-                        move = Move(initial, final)
-                        # check potential checks
-                        if check:
-                            if not self.in_check(piece, move):
-                                # append new move
-                                piece.add_move(move)
-                        else:
-                            # append new move
-                            piece.add_move(move)
-
-            # castling moves
-            if not piece.moved:
-                cols = [0, 7]
-                for r_col in cols:
-                    rook = self.squares[row][r_col].piece
-                    if isinstance(rook, Rook):
-                        if not rook.moved:
-                            step = abs(r_col - col) // (r_col - col)
-                            for c in range(col + step, r_col, step):
-                                if self.squares[row][c].has_piece():
-                                    break
-                            else:
-
-                                if step < 0:
-                                    piece.left_rook = rook
-                                else:
-                                    piece.right_rook = rook
-
-                                initial = Square(row, r_col)
-                                final = Square(row, col + step)
-                                move_rook = Move(initial, final)
-
-                                initial = Square(row, col)
-                                final = Square(row, col + 2 * step)
-                                move_king = Move(initial, final)
-
-                                if check:
-                                    if self.valid_castling(move_king, piece):
-                                        # add rook move
-                                        rook.add_move(move_rook)
-                                        # add king move
-                                        piece.add_move(move_king)
-                                else:
-                                    # add rook move
-                                    rook.add_move(move_rook)
-                                    # add king move
-                                    piece.add_move(move_king)
-
-        if isinstance(piece, Pawn):
-            pawn_moves()
-
-        elif isinstance(piece, Knight):
-            knight_moves()
-
-        elif isinstance(piece, Bishop):
-            straight_line_moves([
-                (-1, 1),  # up-right
-                (-1, -1),  # up-left
-                (1, 1),  # down-right
-                (1, -1),  # down-left
-            ])
-
-        elif isinstance(piece, Rook):
-            straight_line_moves([
-                (-1, 0),  # up
-                (0, 1),  # right
-                (1, 0),  # down
-                (0, -1),  # left
-            ])
-
-        elif isinstance(piece, Queen):
-            straight_line_moves([
-                (-1, 1),  # up-right
-                (-1, -1),  # up-left
-                (1, 1),  # down-right
-                (1, -1),  # down-left
-                (-1, 0),  # up
-                (0, 1),  # right
-                (1, 0),  # down
-                (0, -1)  # left
-            ])
-
-        elif isinstance(piece, King):
-            king_moves()
-
-    def count_score(self) -> int:
-        score = 0
+        color = COLOR_INDEX[piece.color]
+        frm = square_index(row, col)
+        from_mask = 1 << frm
+        if check:
+            # the moves of every piece come from one generation per position
+            codes = [code for code in self.legal_codes(color) if move_from(code) == frm]
+        else:
+            codes = self.position.pseudo_legal_moves(color, from_mask)
+
+        self.valid_codes.update(codes)
+        for code in codes:
+            # promotion piece is chosen after the move, one move per target square
+            if move_promo(code) and PIECE_NAMES[move_promo(code)] != 'queen':
+                continue
+            piece.add_move(self.code_to_move(code))
+
+    # evaluation in pawns from white's point of view, read from the position's incremental terms
+    def count_score(self) -> float:
+        return evaluation.evaluate_white(self.position) / 100
+
+    # builds the bitboard position from squares
+    def _create_position(self):
+        position = Position()
         for row in range(ROWS):
             for col in range(COLS):
-                if self.squares[row][col].has_piece():
-                    piece = self.squares[row][col].piece
-                    score += piece.value
-        return score
+                piece = self.squares[row][col].piece
+                if piece is not None:
+                    position.put(square_index(row, col), COLOR_INDEX[piece.color], PIECE_INDEX[piece.name])
+
+        # castling rights of unmoved kings and rooks on their home squares
+        for row, short, long in ((7, WHITE_OO, WHITE_OOO), (0, BLACK_OO, BLACK_OOO)):
+            king = self.squares[row][4].piece
+            if isinstance(king, King) and not king.moved:
+                for col, right in ((7, short), (0, long)):
+                    rook = self.squares[row][col].piece
+                    if isinstance(rook, Rook) and not rook.moved and rook.color == king.color:
+                        position.castling |= right
+        position.key = position.compute_key()
+        return position
+
+    # builds squares and pieces from the position
+    def _create_squares(self):
+        position = self.position
+        squares = [[Square(row, col) for col in range(COLS)] for row in range(ROWS)]
+        for sq, code in enumerate(position.board):
+            if code < 0:
+                continue
+            row, col = row_col(sq)
+            color = COLOR_NAMES[code // 6]
+            piece = PIECE_CLASSES[PIECE_NAMES[code % 6]](color)
+            # pawns off their start row and pieces without castling rights have moved
+            if isinstance(piece, Pawn):
+                piece.moved = row != (6 if color == 'white' else 1)
+            squares[row][col].piece = piece
+
+        for row, short, long in ((7, WHITE_OO, WHITE_OOO), (0, BLACK_OO, BLACK_OOO)):
+            king = squares[row][4].piece
+            if isinstance(king, King):
+                king.moved = not position.castling & (short | long)
+            for col, right in ((7, short), (0, long)):
+                rook = squares[row][col].piece
+                if isinstance(rook, Rook):
+                    rook.moved = not position.castling & right
+
+        # the pawn that just made a double step stands behind the en-passant square
+        if position.ep >= 0:
+            row, col = row_col(position.ep + 8 if position.turn == BLACK else position.ep - 8)
+            self.en_passant_pawn = squares[row][col].piece
+            self.en_passant_pawn.en_passant = True
+        return squares
 
     # creates a board
     def _create(self):
@@ -0,0 +1,222 @@
+'''
+Opening book: moves played from the first positions of a set of PGN games.
+
+The book file is a small header followed by 12-byte entries sorted by
+position key:
+
+    key (Zobrist key, 8 bytes) | move (from, to, promotion, 2 bytes) | weight (2 bytes)
+
+It is read through mmap and looked up with a binary search, so opening it
+costs nothing, a probe touches a few pages, and processes reading the same
+book share its pages.
+
+    python book.py build games.pgn -o ../assets/book.bin --plies 16 --min-games 2
+    python book.py probe --fen "<fen>" --book ../assets/book.bin
+
+    book = OpeningBook('../assets/book.bin')
+    move = book.probe(position)         # encoded move, 0 when out of book
+'''
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+
+from bitboard import Position, MOVE_MASK, move_name
+from const import *
+import pgn
+
+BOOK_MAGIC = b'CBK1'
+_HEADER = struct.Struct('<4sI')
+_ENTRY = struct.Struct('<QHH')
+_KEY = struct.Struct('<Q')
+
+# weights are stored in 16 bits
+MAX_WEIGHT = 0xFFFF
+
+
+# counts the moves played in the first plies of the games, weighted by their result
+def collect(games, plies=16, min_games=1):
+    '''
+    A move scores 2 for a win of the side that played it, 1 for a draw or an
+    unknown result and 0 for a loss. Moves that only lost are left out.
+    :param games: iterable of pgn.PGNGame
+    :param plies: moves per game taken into the book
+    :param min_games: games a move has to be played in to be kept
+    :return: sorted list of (key, move, weight)
+    '''
+    counts = {}
+    for game in games:
+        white_score = {'1-0': 2, '0-1': 0}.get(game.result, 1)
+        try:
+            for ply, (position, move) in enumerate(game.replay()):
+                if ply >= plies:
+                    break
+                score = white_score if position.turn == 0 else 2 - white_score
+                entry = counts.setdefault((position.key, move & MOVE_MASK), [0, 0])
+                entry[0] += 1
+                entry[1] += score
+        except ValueError:
+            # games with an illegal move are used up to it
+            continue
+
+    entries = []
+    for (key, move), (games_played, score) in counts.items():
+        if games_played >= min_games and score:
+            entries.append((key, move, min(score, MAX_WEIGHT)))
+    # best moves first within a position
+    entries.sort(key=lambda entry: (entry[0], -entry[2], entry[1]))
+    return entries
+
+
+# writes sorted entries to a book file
+def write_book(path, entries):
+    with open(path, 'wb') as file:
+        file.write(_HEADER.pack(BOOK_MAGIC, len(entries)))
+        for entry in entries:
+            file.write(_ENTRY.pack(*entry))
+
+
+# builds a book file from PGN files, returns the number of entries
+def build(pgn_paths, path, plies=16, min_games=1) -> int:
+    def games():
+        for pgn_path in pgn_paths:
+            with open(pgn_path, encoding='utf-8', errors='replace') as file:
+                yield from pgn.read_games(file)
+
+    entries = collect(games(), plies, min_games)
+    write_book(path, entries)
+    return len(entries)
+
+
+class OpeningBook:
+    '''
+    Read-only view of a book file through mmap.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        if size < _HEADER.size:
+            self.file.close()
+            raise ValueError(f'{path} is not a book file')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = _HEADER.unpack_from(self.data, 0)
+        if magic != BOOK_MAGIC or size != _HEADER.size + self.count * _ENTRY.size:
+            self.close()
+            raise ValueError(f'{path} is not a book file')
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        self.file.close()
+
+    # index of the first entry with a key not below key
+    def _lower_bound(self, key):
+        data = self.data
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _KEY.unpack_from(data, _HEADER.size + mid * _ENTRY.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # (move, weight) pairs stored for a position key, best first
+    def entries(self, key):
+        '''
+        :return: list of (move without flags, weight)
+        '''
+        data = self.data
+        found = []
+        offset = _HEADER.size + self._lower_bound(key) * _ENTRY.size
+        end = _HEADER.size + self.count * _ENTRY.size
+        while offset < end:
+            entry_key, move, weight = _ENTRY.unpack_from(data, offset)
+            if entry_key != key:
+                break
+            found.append((move, weight))
+            offset += _ENTRY.size
+        return found
+
+    # book moves that are legal in the position, as encoded moves with flags
+    def moves(self, position: Position):
+        '''
+        :return: list of (encoded move, weight), empty when the position is out of book
+        '''
+        found = self.entries(position.key)
+        if not found:
+            return []
+        # matching against the legal moves restores the flags and guards against key collisions
+        legal = {move & MOVE_MASK: move for move in position.legal_moves()}
+        return [(legal[move], weight) for move, weight in found if move in legal]
+
+    # picks a book move at random, in proportion to its weight
+    def probe(self, position: Position, rng=random) -> int:
+        '''
+        :param rng: random source, pass random.Random(seed) for repeatable choices
+        :return: encoded move, 0 when the position is out of book
+        '''
+        found = self.moves(position)
+        if not found:
+            return 0
+        total = sum(weight for _, weight in found)
+        pick = rng.randrange(total)
+        for move, weight in found:
+            pick -= weight
+            if pick < 0:
+                return move
+        return found[0][0]
+
+
+# opens the book at path, None if there is no book
+def load(path=BOOK_PATH):
+    if not os.path.exists(path):
+        return None
+    try:
+        return OpeningBook(path)
+    except ValueError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='build and query opening books')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='build a book from PGN files')
+    build_parser.add_argument('pgn', nargs='+', help='PGN files')
+    build_parser.add_argument('-o', '--out', default=BOOK_PATH, help='book file to write')
+    build_parser.add_argument('--plies', type=int, default=16, help='moves per game taken into the book')
+    build_parser.add_argument('--min-games', type=int, default=1, help='games a move has to be played in')
+    probe_parser = commands.add_parser('probe', help='list the book moves of a position')
+    probe_parser.add_argument('--fen', help='position, the start position by default')
+    probe_parser.add_argument('--book', default=BOOK_PATH, help='book file')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        count = build(args.pgn, args.out, args.plies, args.min_games)
+        print(f'{count} entries written to {args.out}')
+        return 0
+
+    position = Position.from_fen(args.fen) if args.fen else Position.start()
+    with OpeningBook(args.book) as book:
+        for move, weight in book.moves(position):
+            print(f'{pgn.move_to_san(position, move):8} {move_name(move):6} {weight}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,8 @@
 # Screen dimensions
 WIDTH = 800
 HEIGHT = 800
+# frame cap of the main loop
+FPS = 60
 
 # Board dimensions
 ROWS = 8
@@ -10,3 +12,27 @@ SQSIZE = WIDTH // COLS
 # AI values
 CHECKMATE_VALUE = 10000
 STALEMATE_VALUE = 0
+# scores beyond this are mates, counted in plies from the node or the root;
+# wide enough for the longest tablebase mates plus the plies searched before them
+MATE_BOUND = CHECKMATE_VALUE - 256
+
+# search
+MAX_SEARCH_DEPTH = 64
+AI_TIME_MS = 1000
+TT_SIZE_MB = 16
+# positions whose legal moves the board keeps for the interface
+MOVE_CACHE_SIZE = 256
+
+# game history: plies between FEN snapshots, plies the board keeps undo records for
+HISTORY_SNAPSHOT_EVERY = 32
+HISTORY_UNDO_LIMIT = 256
+# plies of undo records the board always keeps, so repetitions are still seen after undo and jumps
+HISTORY_REPETITION_PLIES = 100
+# cross-check the incremental evaluation against a full one at every leaf (slow)
+DEBUG_EVAL = False
+# centipawn values by bitboard piece type (pawn, knight, bishop, rook, queen, king)
+PIECE_VALUES = (100, 300, 300, 500, 900, 0)
+# opening book built by book.py, the engine searches from the first move without it
+BOOK_PATH = '../assets/book.bin'
+# endgame tables generated by endgame.py, probed by the search when the directory exists
+TABLEBASE_DIR = '../assets/tablebases'
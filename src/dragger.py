@@ -1,11 +1,11 @@
-import pygame
-
 from const import *
 
 
 class Dragger:
 
-    def __init__(self):
+    def __init__(self, sprites):
+        # shared piece images
+        self.sprites = sprites
         self.piece = None
         self.dragging = False
         self.mouseX = 0
@@ -16,16 +16,19 @@ class Dragger:
     # blit method
 
     def update_blit(self, surface):
-        # texture
-        self.piece.set_texture(size=128)
-        texture = self.piece.texture
         # img
-        img = pygame.image.load(texture)
+        img = self.sprites.get(self.piece, size=128)
         # rect
-        img_center = (self.mouseX, self.mouseY)
-        self.piece.texture_rect = img.get_rect(center=img_center)
+        rect = self.get_rect()
         # blit
-        surface.blit(img, self.piece.texture_rect)
+        surface.blit(img, rect)
+        return rect
+
+    # screen area covered by the dragged piece
+    def get_rect(self):
+        img = self.sprites.get(self.piece, size=128)
+        img_center = (self.mouseX, self.mouseY)
+        return img.get_rect(center=img_center)
 
     # other methods
 
@@ -0,0 +1,590 @@
+'''
+Endgame tablebases: win/draw/loss and distance to mate of every position
+with up to four pieces, kings included.
+
+Tables are generated by retrograde analysis: mates are resolved first, then
+every position one move before a resolved one, ply by ply, so the first time
+a position is found won its distance is the shortest mate. Captures and
+promotions lead into smaller tables, which are generated first.
+
+One table per material, e.g. KQvK or KRvKB, one byte per position:
+
+    0           draw
+    1 .. 127    the side to move mates in that many plies
+    128 + n     the side to move is mated in n plies
+
+Positions are indexed with the white king moved into a1-d1-d4 by the
+symmetries of the board (files a-d only when there are pawns), so KQvK
+takes 80 KB and a four-piece table about 5 MB. Files are memory-mapped when
+probed, worker processes share their pages.
+
+Tables with pawns of both sides are not covered, en passant never arises in
+the others. Positions with castling rights are not probed.
+
+    python endgame.py generate KQvK KRvK KPvK --dir ../assets/tablebases
+    python endgame.py probe --fen "8/8/8/8/8/2k5/8/KQ6 w - - 0 1"
+'''
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from bitboard import (Position, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, popcount,
+                      KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, bishop_attacks, rook_attacks, queen_attacks)
+from const import *
+
+# pieces of the largest tables, kings included
+MAX_PIECES = 4
+
+TABLE_MAGIC = b'CTB1'
+_HEADER = struct.Struct('<4s16sI')
+
+# value bytes
+DRAW = 0
+LOSS = 128
+
+_LETTERS = 'PNBRQK'
+
+
+# symmetries of the board as square tables, the identity first
+def _transforms():
+    def transpose(sq):
+        return ((sq & 7) << 3) | (sq >> 3)
+    result = []
+    for flip in (0, 7, 56, 63):
+        result.append([sq ^ flip for sq in range(64)])
+    for flip in (0, 7, 56, 63):
+        result.append([transpose(sq) ^ flip for sq in range(64)])
+    return result
+
+
+_TRANSFORMS = _transforms()
+# squares of the white king in the index: a1-d1-d4 without pawns, files a-d with pawns
+_KING_SQUARES = (
+    [sq for sq in range(64) if (sq & 7) < 4 and (sq >> 3) <= (sq & 7)],
+    [sq for sq in range(64) if (sq & 7) < 4],
+)
+
+
+class TableLayout:
+    '''
+    Index of the positions of one material: white king slot, the squares of
+    the other pieces, the side to move.
+    '''
+
+    def __init__(self, pieces):
+        '''
+        :param pieces: (color, type) pairs, white king, black king, then the other pieces
+        '''
+        self.pieces = pieces
+        pawns = any(ptype == PAWN for _, ptype in pieces)
+        transforms = _TRANSFORMS[:2] if pawns else _TRANSFORMS
+        self.kings = _KING_SQUARES[pawns]
+        slots = {sq: i for i, sq in enumerate(self.kings)}
+        self.slots = [slots.get(sq, -1) for sq in range(64)]
+        # board symmetry that brings a white king square into the index
+        self.canon = [next(t for t in transforms if t[sq] in slots) for sq in range(64)]
+        # with the white king on the a1-d4 diagonal a position and its mirror image on it are
+        # both in the index
+        self.twin = None if pawns else _TRANSFORMS[4]
+        self.size = len(self.kings) * 64 ** (len(pieces) - 1) * 2
+
+    def index(self, squares, stm):
+        transform = self.canon[squares[0]]
+        idx = self.slots[transform[squares[0]]]
+        for sq in squares[1:]:
+            idx = idx * 64 + transform[sq]
+        return idx * 2 + stm
+
+    # every index of a position, the one of index() and the one of its mirror image if it has one
+    def indices(self, squares, stm):
+        idx = self.index(squares, stm)
+        if self.twin is None:
+            return idx,
+        king = self.canon[squares[0]][squares[0]]
+        if king >> 3 != king & 7:
+            return idx,
+        twin = self.twin
+        return idx, self.index([twin[sq] for sq in squares], stm)
+
+    # squares and side to move of an index
+    def decode(self, idx):
+        stm = idx & 1
+        idx >>= 1
+        squares = [0] * len(self.pieces)
+        for i in range(len(squares) - 1, 0, -1):
+            squares[i] = idx & 63
+            idx >>= 6
+        squares[0] = self.kings[idx]
+        return squares, stm
+
+
+_layouts = {}
+
+
+def _layout(pieces):
+    layout = _layouts.get(pieces)
+    if layout is None:
+        layout = _layouts[pieces] = TableLayout(pieces)
+    return layout
+
+
+# name of a material, white first: KQvK
+def signature(pieces) -> str:
+    white = ''.join(_LETTERS[ptype] for color, ptype in pieces if color == WHITE)
+    black = ''.join(_LETTERS[ptype] for color, ptype in pieces if color == BLACK)
+    return f'{white}v{black}'
+
+
+# pieces of a material name, in index order
+def parse_signature(name):
+    white, _, black = name.upper().partition('V')
+    if white.count('K') != 1 or black.count('K') != 1 or not set(white + black) <= set(_LETTERS):
+        raise ValueError(f'invalid material: {name}')
+    if len(white) + len(black) > MAX_PIECES:
+        raise ValueError(f'tables have at most {MAX_PIECES} pieces: {name}')
+    pieces = [(WHITE, _LETTERS.index(letter)) for letter in white] \
+        + [(BLACK, _LETTERS.index(letter)) for letter in black]
+    if any(color == WHITE and ptype == PAWN for color, ptype in pieces) \
+            and any(color == BLACK and ptype == PAWN for color, ptype in pieces):
+        raise ValueError(f'tables with pawns of both sides are not supported: {name}')
+    return _sort(pieces, [0] * len(pieces))[0]
+
+
+# pieces in index order (kings, white pieces, black pieces, strongest first) with their squares
+def _sort(pieces, squares):
+    order = sorted(range(len(pieces)), key=lambda i: (pieces[i][1] != KING, pieces[i][0], -pieces[i][1]))
+    return tuple(pieces[i] for i in order), [squares[i] for i in order]
+
+
+# whether the pieces are stored with the colors swapped, the stronger side is white in the tables
+def _flipped(pieces) -> bool:
+    def strength(color):
+        types = sorted((ptype for c, ptype in pieces if c == color), reverse=True)
+        return sum(PIECE_VALUES[ptype] for ptype in types), types
+    return strength(BLACK) > strength(WHITE)
+
+
+# value byte of a position, None if its table is missing
+def _lookup(get_table, pieces, squares, stm):
+    '''
+    :param get_table: returns the value bytes of a material name, or None
+    :param pieces: (color, type) pairs in any order, kings included
+    '''
+    if len(pieces) == 2:
+        return DRAW
+    if _flipped(pieces):
+        pieces = [(color ^ 1, ptype) for color, ptype in pieces]
+        squares = [sq ^ 56 for sq in squares]
+        stm ^= 1
+    pieces, squares = _sort(pieces, squares)
+    table = get_table(signature(pieces))
+    if table is None:
+        return None
+    return table[_layout(pieces).index(squares, stm)]
+
+
+def _attacks(color, ptype, sq, occ):
+    if ptype == PAWN:
+        return PAWN_ATTACKS[color][sq]
+    if ptype == KNIGHT:
+        return KNIGHT_ATTACKS[sq]
+    if ptype == BISHOP:
+        return bishop_attacks(sq, occ)
+    if ptype == ROOK:
+        return rook_attacks(sq, occ)
+    if ptype == QUEEN:
+        return queen_attacks(sq, occ)
+    return KING_ATTACKS[sq]
+
+
+# checks whether color attacks sq
+def _attacked(pieces, squares, sq, color, occ):
+    for (piece_color, ptype), frm in zip(pieces, squares):
+        if piece_color == color and _attacks(color, ptype, frm, occ) >> sq & 1:
+            return True
+    return False
+
+
+# positions after every legal move, as (pieces, squares); pieces is the same object unless a piece was
+# captured or promoted
+def _children(pieces, squares, stm):
+    occupied = [0, 0]
+    for (color, _), sq in zip(pieces, squares):
+        occupied[color] |= 1 << sq
+    occ = occupied[0] | occupied[1]
+    own = occupied[stm]
+    enemy = occupied[stm ^ 1]
+    step = 8 if stm == WHITE else -8
+
+    for i, (color, ptype) in enumerate(pieces):
+        if color != stm:
+            continue
+        frm = squares[i]
+        if ptype == PAWN:
+            targets = PAWN_ATTACKS[stm][frm] & enemy
+            to = frm + step
+            if not occ >> to & 1:
+                targets |= 1 << to
+                if frm >> 3 == (1 if stm == WHITE else 6) and not occ >> (to + step) & 1:
+                    targets |= 1 << (to + step)
+        else:
+            targets = _attacks(stm, ptype, frm, occ) & ~own
+        while targets:
+            bb = targets & -targets
+            targets ^= bb
+            to = bb.bit_length() - 1
+            child_pieces = pieces
+            child_squares = list(squares)
+            child_squares[i] = to
+            child_occ = occ ^ (1 << frm) | bb
+            # index of the moved piece in the child
+            k = i
+            if enemy & bb:
+                j = squares.index(to)
+                child_pieces = pieces[:j] + pieces[j + 1:]
+                del child_squares[j]
+                if j < i:
+                    k -= 1
+            # kings come first and are never captured
+            if _attacked(child_pieces, child_squares, child_squares[stm], stm ^ 1, child_occ):
+                continue
+            if ptype == PAWN and to >> 3 in (0, 7):
+                for promo in (QUEEN, ROOK, BISHOP, KNIGHT):
+                    yield child_pieces[:k] + ((stm, promo),) + child_pieces[k + 1:], child_squares
+            else:
+                yield child_pieces, child_squares
+
+
+# positions one move earlier without a capture or promotion, the side to move is stm ^ 1 in them
+def _parents(pieces, squares, stm):
+    mover = stm ^ 1
+    occ = 0
+    for sq in squares:
+        occ |= 1 << sq
+    step = 8 if mover == WHITE else -8
+
+    for i, (color, ptype) in enumerate(pieces):
+        if color != mover:
+            continue
+        to = squares[i]
+        if ptype == PAWN:
+            origins = 0
+            frm = to - step
+            if 8 <= frm < 56 and not occ >> frm & 1:
+                origins = 1 << frm
+                if to >> 3 == (3 if mover == WHITE else 4) and not occ >> (frm - step) & 1:
+                    origins |= 1 << (frm - step)
+        else:
+            origins = _attacks(mover, ptype, to, occ) & ~occ
+        while origins:
+            bb = origins & -origins
+            origins ^= bb
+            parent = list(squares)
+            parent[i] = bb.bit_length() - 1
+            # the side that didn't move can't be in check before the move
+            if not _attacked(pieces, parent, parent[stm], mover, occ ^ (1 << to) | bb):
+                yield parent
+
+
+# checks that no squares are shared, pawns are on ranks 2-7 and the side not to move isn't in check
+def _valid(pieces, squares, stm):
+    if len(set(squares)) != len(squares):
+        return False
+    occ = 0
+    for (_, ptype), sq in zip(pieces, squares):
+        if ptype == PAWN and sq >> 3 in (0, 7):
+            return False
+        occ |= 1 << sq
+    return not _attacked(pieces, squares, squares[stm ^ 1], stm, occ)
+
+
+# retrograde analysis of one material
+def generate_table(pieces, get_table):
+    '''
+    :param pieces: pieces in index order, see parse_signature
+    :param get_table: returns the value bytes of the smaller tables captures and promotions lead to
+    :return: bytearray of values, one per index
+    '''
+    layout = _layout(pieces)
+    values = bytearray(layout.size)
+    resolved = bytearray(layout.size)
+    # positions won in n plies, and positions that may be lost in n plies, by n
+    wins = [array('I') for _ in range(LOSS)]
+    losses = [array('I') for _ in range(LOSS)]
+
+    # value byte from the values of the moves, None while it depends on unresolved positions
+    def evaluate(squares, stm):
+        best_win = LOSS
+        worst_loss = -1
+        open_move = False
+        has_move = False
+        for child_pieces, child_squares in _children(pieces, squares, stm):
+            has_move = True
+            if child_pieces is pieces:
+                child = layout.index(child_squares, stm ^ 1)
+                if not resolved[child]:
+                    open_move = True
+                    continue
+                value = values[child]
+            else:
+                value = _lookup(get_table, child_pieces, child_squares, stm ^ 1)
+            if value >= LOSS:
+                best_win = min(best_win, value - LOSS + 1)
+            elif value:
+                worst_loss = max(worst_loss, value)
+            else:
+                open_move = True
+        if not has_move:
+            occ = 0
+            for sq in squares:
+                occ |= 1 << sq
+            # checkmate or stalemate
+            return LOSS if _attacked(pieces, squares, squares[stm], stm ^ 1, occ) else DRAW
+        if best_win < LOSS:
+            return best_win
+        if not open_move:
+            return LOSS + worst_loss + 1
+        return None
+
+    # value byte of a lost position, None as soon as one move isn't known to lose
+    def lost_value(squares, stm):
+        worst_loss = -1
+        for child_pieces, child_squares in _children(pieces, squares, stm):
+            if child_pieces is pieces:
+                child = layout.index(child_squares, stm ^ 1)
+                if not resolved[child]:
+                    return None
+                value = values[child]
+            else:
+                value = _lookup(get_table, child_pieces, child_squares, stm ^ 1)
+            if not value or value >= LOSS:
+                return None
+            worst_loss = max(worst_loss, value)
+        return LOSS + worst_loss + 1
+
+    # mates, stalemates and what captures and promotions decide
+    for idx in range(layout.size):
+        squares, stm = layout.decode(idx)
+        if not _valid(pieces, squares, stm):
+            resolved[idx] = 1
+            continue
+        value = evaluate(squares, stm)
+        if value == DRAW:
+            resolved[idx] = 1
+        elif value is not None:
+            (losses if value >= LOSS else wins)[value & (LOSS - 1)].append(idx)
+
+    # ply by ply, so a position is resolved with its shortest win or longest loss
+    for plies in range(LOSS):
+        for idx in wins[plies]:
+            if resolved[idx]:
+                continue
+            resolved[idx] = 1
+            values[idx] = plies
+            if plies + 1 < LOSS:
+                squares, stm = layout.decode(idx)
+                for parent in _parents(pieces, squares, stm):
+                    for parent_idx in layout.indices(parent, stm ^ 1):
+                        if not resolved[parent_idx]:
+                            losses[plies + 1].append(parent_idx)
+        wins[plies] = None
+
+        for idx in losses[plies]:
+            if resolved[idx]:
+                continue
+            squares, stm = layout.decode(idx)
+            value = lost_value(squares, stm)
+            if value is None:
+                continue
+            if value - LOSS > plies:
+                losses[value - LOSS].append(idx)
+                continue
+            resolved[idx] = 1
+            values[idx] = value
+            if plies + 1 < LOSS:
+                for parent in _parents(pieces, squares, stm):
+                    for parent_idx in layout.indices(parent, stm ^ 1):
+                        if not resolved[parent_idx]:
+                            wins[plies + 1].append(parent_idx)
+        losses[plies] = None
+    return values
+
+
+# file name of a table
+def table_path(directory, name):
+    return os.path.join(directory, name + '.ctb')
+
+
+# generates tables and the smaller ones they need into a directory, skipping tables already there
+def generate(names, directory=TABLEBASE_DIR, log=None):
+    '''
+    :param names: material names, e.g. KQvK; the weaker side is moved to black
+    :param log: called with a message for every table written
+    :return: names of the tables written
+    '''
+    os.makedirs(directory, exist_ok=True)
+    tables = {}
+    written = []
+
+    def get_table(name):
+        if name not in tables:
+            path = table_path(directory, name)
+            if os.path.exists(path):
+                tables[name] = read_table(path)
+            else:
+                pieces = parse_signature(name)
+                values = generate_table(pieces, get_table)
+                write_table(path, name, values)
+                written.append(name)
+                if log is not None:
+                    log(f'{name}: {len(values)} positions')
+                tables[name] = values
+        return tables[name]
+
+    for name in names:
+        pieces = parse_signature(name)
+        if _flipped(pieces):
+            pieces = _sort([(color ^ 1, ptype) for color, ptype in pieces], [0] * len(pieces))[0]
+        get_table(signature(pieces))
+    return written
+
+
+def write_table(path, name, values):
+    with open(path, 'wb') as file:
+        file.write(_HEADER.pack(TABLE_MAGIC, name.encode('ascii'), len(values)))
+        file.write(values)
+
+
+# value bytes of a table file, checked against its header
+def read_table(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    return _check_table(path, data)
+
+
+def _check_table(path, data):
+    if len(data) < _HEADER.size:
+        raise ValueError(f'{path} is not a tablebase file')
+    magic, name, size = _HEADER.unpack_from(data, 0)
+    name = name.rstrip(b'\0').decode('ascii', 'replace')
+    if magic != TABLE_MAGIC or len(data) != _HEADER.size + size \
+            or size != _layout(parse_signature(name)).size:
+        raise ValueError(f'{path} is not a tablebase file')
+    return memoryview(data)[_HEADER.size:]
+
+
+class Tablebase:
+    '''
+    Probes the tables of a directory, each one memory-mapped when first needed.
+    '''
+
+    def __init__(self, directory=TABLEBASE_DIR):
+        self.directory = directory
+        self.tables = {}
+        self.files = []
+        self.names = {name[:-4] for name in os.listdir(directory) if name.endswith('.ctb')}
+        # statistics
+        self.probes = 0
+        self.hits = 0
+
+    def _table(self, name):
+        table = self.tables.get(name)
+        if table is None and name in self.names:
+            path = table_path(self.directory, name)
+            with open(path, 'rb') as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.files.append(data)
+            table = self.tables[name] = _check_table(path, data)
+        return table
+
+    def close(self):
+        for table in self.tables.values():
+            table.release()
+        self.tables = {}
+        for data in self.files:
+            data.close()
+        self.files = []
+
+    # value byte of a position, None if it isn't in the tables
+    def probe_value(self, position: Position):
+        if position.castling or position.ep >= 0:
+            return None
+        occ = position.occupied[0] | position.occupied[1]
+        if popcount(occ) > MAX_PIECES:
+            return None
+        self.probes += 1
+        pieces = []
+        squares = []
+        while occ:
+            bb = occ & -occ
+            occ ^= bb
+            sq = bb.bit_length() - 1
+            code = position.board[sq]
+            pieces.append((code // 6, code % 6))
+            squares.append(sq)
+        value = _lookup(self._table, pieces, squares, position.turn)
+        if value is not None:
+            self.hits += 1
+        return value
+
+    # result for the side to move, None if the position isn't in the tables
+    def probe(self, position: Position):
+        '''
+        :return: (1 win / 0 draw / -1 loss, plies to mate), plies is 0 for a draw
+        '''
+        value = self.probe_value(position)
+        if value is None:
+            return None
+        if value >= LOSS:
+            return -1, value - LOSS
+        return (1, value) if value else (0, 0)
+
+    # search score of a position ply plies below the root, None if it isn't in the tables
+    def score(self, position: Position, ply=0):
+        value = self.probe_value(position)
+        if value is None:
+            return None
+        if value >= LOSS:
+            return -(CHECKMATE_VALUE - ply - (value - LOSS))
+        if value:
+            return CHECKMATE_VALUE - ply - value
+        return STALEMATE_VALUE
+
+
+# opens the tables of a directory, None if there are none
+def load(directory=TABLEBASE_DIR):
+    if not os.path.isdir(directory) or not any(name.endswith('.ctb') for name in os.listdir(directory)):
+        return None
+    return Tablebase(directory)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='generate and probe endgame tablebases')
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate_parser = commands.add_parser('generate', help='generate tables and the smaller ones they need')
+    generate_parser.add_argument('names', nargs='+', help='materials, e.g. KQvK KRvK KPvK KQvKR')
+    generate_parser.add_argument('--dir', default=TABLEBASE_DIR, help='directory of the tables')
+    probe_parser = commands.add_parser('probe', help='look a position up')
+    probe_parser.add_argument('--fen', required=True, help='position')
+    probe_parser.add_argument('--dir', default=TABLEBASE_DIR, help='directory of the tables')
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        generate(args.names, args.dir, log=print)
+        return 0
+
+    tablebase = load(args.dir)
+    result = tablebase.probe(Position.from_fen(args.fen)) if tablebase is not None else None
+    if result is None:
+        print('not in the tables')
+        return 1
+    wdl, plies = result
+    print({1: f'win, mate in {plies} plies', 0: 'draw', -1: f'loss, mated in {plies} plies'}[wdl])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+'''
+Tapered material and piece-square evaluation.
+
+Every piece on a square is worth a middlegame and an endgame score (material
+plus its piece-square bonus). Position keeps the sums of both and the game
+phase up to date in put/remove/make/unmake, so evaluate() is O(1):
+
+    score = (mg * phase + eg * (MAX_PHASE - phase)) / MAX_PHASE
+
+Tables are indexed by mailbox code (color * 6 + piece type, pawn..king)
+and square (a1 = 0 ... h8 = 63). Black scores are negative, so the sums
+are from white's point of view.
+
+Custom weights can be loaded from a JSON file with load_weights(); the
+single-position search and the NumPy batch scorer read the same tables.
+'''
+import json
+
+# game phase: 24 with all pieces on the board, 0 with only kings and pawns
+MAX_PHASE = 24
+PHASE_BY_TYPE = (0, 1, 1, 2, 4, 0)
+
+# material in centipawns, pawn..king
+MG_MATERIAL = (82, 337, 365, 477, 1025, 0)
+EG_MATERIAL = (94, 281, 297, 512, 936, 0)
+
+# piece-square tables from white's side, written with rank 8 on top
+_PAWN_MG = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+    5, 5, 10, 25, 25, 10, 5, 5,
+    0, 0, 0, 20, 20, 0, 0, 0,
+    5, -5, -10, 0, 0, -10, -5, 5,
+    5, 10, 10, -20, -20, 10, 10, 5,
+    0, 0, 0, 0, 0, 0, 0, 0,
+)
+_PAWN_EG = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    80, 80, 80, 80, 80, 80, 80, 80,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    30, 30, 30, 30, 30, 30, 30, 30,
+    15, 15, 15, 15, 15, 15, 15, 15,
+    5, 5, 5, 5, 5, 5, 5, 5,
+    0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0,
+)
+_KNIGHT = (
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20, 0, 0, 0, 0, -20, -40,
+    -30, 0, 10, 15, 15, 10, 0, -30,
+    -30, 5, 15, 20, 20, 15, 5, -30,
+    -30, 0, 15, 20, 20, 15, 0, -30,
+    -30, 5, 10, 15, 15, 10, 5, -30,
+    -40, -20, 0, 5, 5, 0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50,
+)
+_BISHOP = (
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 10, 10, 5, 0, -10,
+    -10, 5, 5, 10, 10, 5, 5, -10,
+    -10, 0, 10, 10, 10, 10, 0, -10,
+    -10, 10, 10, 10, 10, 10, 10, -10,
+    -10, 5, 0, 0, 0, 0, 5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20,
+)
+_ROOK = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    5, 10, 10, 10, 10, 10, 10, 5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    0, 0, 0, 5, 5, 0, 0, 0,
+)
+_QUEEN = (
+    -20, -10, -10, -5, -5, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 5, 5, 5, 0, -10,
+    -5, 0, 5, 5, 5, 5, 0, -5,
+    0, 0, 5, 5, 5, 5, 0, -5,
+    -10, 5, 5, 5, 5, 5, 0, -10,
+    -10, 0, 5, 0, 0, 0, 0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20,
+)
+_KING_MG = (
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    20, 20, 0, 0, 0, 0, 20, 20,
+    20, 30, 10, 0, 0, 10, 30, 20,
+)
+_KING_EG = (
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50,
+)
+
+PST_MG = (_PAWN_MG, _KNIGHT, _BISHOP, _ROOK, _QUEEN, _KING_MG)
+PST_EG = (_PAWN_EG, _KNIGHT, _BISHOP, _ROOK, _QUEEN, _KING_EG)
+
+
+# [code][square] tables of signed material plus piece-square scores
+def build_tables(mg_material=MG_MATERIAL, eg_material=EG_MATERIAL, pst_mg=PST_MG, pst_eg=PST_EG):
+    '''
+    :return: (mg table, eg table, phase by code)
+    '''
+    mg = []
+    eg = []
+    for color, sign in ((0, 1), (1, -1)):
+        for ptype in range(6):
+            # the tables are drawn rank 8 first from white's side, black mirrors them
+            mg.append([sign * (mg_material[ptype] + pst_mg[ptype][sq ^ 56 if color == 0 else sq])
+                       for sq in range(64)])
+            eg.append([sign * (eg_material[ptype] + pst_eg[ptype][sq ^ 56 if color == 0 else sq])
+                       for sq in range(64)])
+    return mg, eg, list(PHASE_BY_TYPE) * 2
+
+
+# shared with Position, which keeps its sums with them, and with batch_eval
+MG_TABLE, EG_TABLE, PHASE_TABLE = build_tables()
+
+# weights the tables were built from
+WEIGHTS = {
+    'mg_material': list(MG_MATERIAL),
+    'eg_material': list(EG_MATERIAL),
+    'pst_mg': [list(table) for table in PST_MG],
+    'pst_eg': [list(table) for table in PST_EG],
+    'phase': list(PHASE_BY_TYPE),
+}
+
+
+# values of one weight as a list, raises ValueError if there are not length of them
+def _weight_list(name, values, length):
+    try:
+        values = list(values)
+    except TypeError:
+        raise ValueError(f'{name} needs a list of {length} values, not {type(values).__name__}') from None
+    if len(values) != length:
+        raise ValueError(f'{name} needs {length} values, got {len(values)}')
+    return values
+
+
+# replaces the weights of every evaluation, the tables are changed in place
+def set_weights(weights):
+    '''
+    Positions created before the call keep sums of the old weights, so set
+    the weights before setting positions up.
+    :param weights: dict with any of the keys of WEIGHTS, missing keys keep their value,
+        raises ValueError if a value has the wrong shape
+    '''
+    global WEIGHTS
+    merged = dict(WEIGHTS)
+    merged.update(weights)
+    # lists and tuples are both accepted, the merged weights are kept as lists
+    for name in ('mg_material', 'eg_material', 'phase'):
+        merged[name] = _weight_list(name, merged[name], 6)
+    for name in ('pst_mg', 'pst_eg'):
+        merged[name] = [_weight_list(f'{name}[{ptype}]', table, 64)
+                        for ptype, table in enumerate(_weight_list(name, merged[name], 6))]
+
+    mg, eg, _ = build_tables(merged['mg_material'], merged['eg_material'], merged['pst_mg'], merged['pst_eg'])
+    for code in range(12):
+        MG_TABLE[code][:] = mg[code]
+        EG_TABLE[code][:] = eg[code]
+    PHASE_TABLE[:] = list(merged['phase']) * 2
+    WEIGHTS = merged
+
+
+# loads weights from a JSON file written by save_weights
+def load_weights(path):
+    with open(path) as file:
+        set_weights(json.load(file))
+
+
+def save_weights(path):
+    with open(path, 'w') as file:
+        json.dump(WEIGHTS, file)
+
+
+# tapered score in centipawns from white's point of view
+def evaluate_white(position) -> int:
+    phase = min(position.phase, MAX_PHASE)
+    return (position.mg * phase + position.eg * (MAX_PHASE - phase)) // MAX_PHASE
+
+
+# tapered score in centipawns from the side to move's point of view, O(1)
+def evaluate(position) -> int:
+    score = evaluate_white(position)
+    return score if position.turn == 0 else -score
+
+
+# (mg, eg, phase) summed over the whole board, the slow reference for the incremental sums
+def full_terms(position):
+    mg = eg = phase = 0
+    for sq, code in enumerate(position.board):
+        if code >= 0:
+            mg += MG_TABLE[code][sq]
+            eg += EG_TABLE[code][sq]
+            phase += PHASE_TABLE[code]
+    return mg, eg, phase
+
+
+# debug cross-check of the incremental terms, raises AssertionError when they drifted
+def check(position):
+    terms = full_terms(position)
+    if terms != (position.mg, position.eg, position.phase):
+        raise AssertionError(f'incremental eval {(position.mg, position.eg, position.phase)} != full {terms}')
@@ -1,3 +1,5 @@
+import datetime
+import io
 import pygame
 import string
 
@@ -8,21 +10,26 @@ from config import Config
 from square import Square
 from piece import *
 from ai_chess import AI_engine
+from history import GameHistory
+from sprites import Sprites
+from bitboard import START_FEN
+import pgn
 
 
 class Game:
 
-    def __init__(self):
-        self.next_player = 'white'
+    def __init__(self, sprites=None, fen=None):
         self.hovered_sqr = None
-        self.board = Board()
+        self.board = Board(fen)
+        self.next_player = self.board.turn
         self.ai_engine = AI_engine()
-        self.dragger = Dragger()
+        # piece images are loaded once and shared with the dragger
+        self.sprites = sprites if sprites is not None else Sprites()
+        self.dragger = Dragger(self.sprites)
         self.config = Config()
         self.promoting = False
-        # for keeping move log and for undoing moves
+        # for keeping move log, moves are undone by the board
         self.moves = []
-        self.changed_squares = []
         # necessary for not recalculating moves
         self.clicked_square = Square(0, 0)
         self.released_square = Square(7, 7)
@@ -33,6 +40,16 @@ class Game:
         self.game_over = False
         # game mode (PvP/PvE/CompVsComp)
         self.player = {'white': True, 'black': True}
+        # the board stays headless, sounds are played by observing its moves
+        self.board.add_observer(self.on_move)
+        # every ply of the game for undo, redo and jumps
+        self.history = GameHistory(self.board)
+        self.board.add_observer(self.history.on_move)
+        # dirty-rectangle rendering: squares to redraw and whether everything is
+        self.dirty = set()
+        self.full_redraw = True
+        # board background with coordinates, rendered once per theme
+        self.backgrounds = {}
 
     # blit methods
     def show_all(self, surface, show_hover=True, show_moves=True, show_promotion=True):
@@ -47,8 +64,16 @@ class Game:
             self.show_promotion(surface)
 
     def show_background(self, surface):
+        surface.blit(self.get_background(), (0, 0))
+
+    # background squares and coordinate labels of the current theme
+    def get_background(self) -> pygame.Surface:
         theme = self.config.theme
+        background = self.backgrounds.get(theme)
+        if background is not None:
+            return background
 
+        background = pygame.Surface((WIDTH, HEIGHT)).convert()
         for row in range(ROWS):
             for col in range(COLS):
                 # color
@@ -56,7 +81,7 @@ class Game:
                 # rect
                 rect = (col * SQSIZE, row * SQSIZE, SQSIZE, SQSIZE)
                 # blit
-                pygame.draw.rect(surface, color, rect)
+                pygame.draw.rect(background, color, rect)
 
                 # row coordinates
                 if col == 0:
@@ -66,7 +91,7 @@ class Game:
                     lbl = self.config.font.render(str(ROWS - row), 1, color)
                     lbl_pos = (5, 5 + row * SQSIZE)
                     # blit
-                    surface.blit(lbl, lbl_pos)
+                    background.blit(lbl, lbl_pos)
 
                 # col coordinates
                 if row == 7:
@@ -76,7 +101,10 @@ class Game:
                     lbl = self.config.font.render(Square.get_alphacol(col), 1, color)
                     lbl_pos = (col * SQSIZE + SQSIZE - 20, HEIGHT - 20)
                     # blit
-                    surface.blit(lbl, lbl_pos)
+                    background.blit(lbl, lbl_pos)
+
+        self.backgrounds[theme] = background
+        return background
 
     def show_pieces(self, surface):
         for row in range(ROWS):
@@ -87,11 +115,9 @@ class Game:
 
                     # all pieces except dragger piece
                     if piece is not self.dragger.piece:
-                        piece.set_texture(size=80)
-                        img = pygame.image.load(piece.texture)
+                        img = self.sprites.get(piece, size=80)
                         img_center = col * SQSIZE + SQSIZE // 2, row * SQSIZE + SQSIZE // 2
-                        piece.texture_rect = img.get_rect(center=img_center)
-                        surface.blit(img, piece.texture_rect)
+                        surface.blit(img, img.get_rect(center=img_center))
 
     def show_moves(self, surface):
         theme = self.config.theme
@@ -108,6 +134,86 @@ class Game:
                 # blit
                 pygame.draw.rect(surface, color, rect)
 
+    # redraws one square with everything on it, returns its screen rect
+    def show_square(self, surface, row, col) -> pygame.Rect:
+        theme = self.config.theme
+        rect = pygame.Rect(col * SQSIZE, row * SQSIZE, SQSIZE, SQSIZE)
+        light = (row + col) % 2 == 0
+
+        # background and labels
+        surface.blit(self.get_background(), rect, rect)
+
+        # last move
+        last_move = self.board.last_move
+        if last_move:
+            for pos in [last_move.initial, last_move.final]:
+                if pos.row == row and pos.col == col:
+                    pygame.draw.rect(surface, theme.trace.light if light else theme.trace.dark, rect)
+
+        # valid moves of the dragged piece
+        if self.dragger.dragging:
+            for move in self.dragger.piece.moves:
+                if move.final.row == row and move.final.col == col:
+                    pygame.draw.rect(surface, theme.moves.light if light else theme.moves.dark, rect)
+                    break
+
+        # piece, the dragged one is drawn by the dragger
+        piece = self.board.squares[row][col].piece
+        if piece is not None and piece is not self.dragger.piece:
+            img = self.sprites.get(piece, size=80)
+            surface.blit(img, img.get_rect(center=rect.center))
+
+        # hover
+        if self.hovered_sqr and self.hovered_sqr.row == row and self.hovered_sqr.col == col:
+            pygame.draw.rect(surface, (180, 180, 180), rect, width=3)
+
+        return rect
+
+    # marks one square for redrawing
+    def mark_dirty(self, row, col):
+        if 0 <= row < ROWS and 0 <= col < COLS:
+            self.dirty.add((row, col))
+
+    # marks every square a screen rect touches
+    def mark_rect_dirty(self, rect):
+        for row in range(max(0, rect.top // SQSIZE), min(ROWS - 1, (rect.bottom - 1) // SQSIZE) + 1):
+            for col in range(max(0, rect.left // SQSIZE), min(COLS - 1, (rect.right - 1) // SQSIZE) + 1):
+                self.dirty.add((row, col))
+
+    # marks a piece's square and its move highlights
+    def mark_moves_dirty(self, piece, row, col):
+        self.mark_dirty(row, col)
+        for move in piece.moves:
+            self.mark_dirty(move.final.row, move.final.col)
+
+    # next render() redraws the whole screen
+    def mark_all_dirty(self):
+        self.full_redraw = True
+
+    # draws what changed since the last call
+    def render(self, surface) -> list:
+        '''
+        :param surface: screen
+        :return: list of rects to pass to pygame.display.update, empty when idle
+        '''
+        # texts cover several squares, so a finished game is always redrawn whole
+        if self.game_over and self.dirty:
+            self.full_redraw = True
+
+        if self.full_redraw:
+            self.show_all(surface, show_promotion=False)
+            rects = [surface.get_rect()]
+        else:
+            rects = [self.show_square(surface, row, col) for row, col in self.dirty]
+
+        # dragged piece goes on top of whatever was redrawn below it
+        if rects and self.dragger.dragging:
+            rects.append(self.dragger.update_blit(surface))
+
+        self.dirty.clear()
+        self.full_redraw = False
+        return rects
+
     # shows some text in the center of a screen
     def show_text(self, surface, text):
         # creates font
@@ -118,6 +224,7 @@ class Game:
         text_location.center = (WIDTH // 2, HEIGHT // 2)
         # draws text
         surface.blit(text_object, text_location)
+        return text_location
 
     def show_last_move(self, surface):
         theme = self.config.theme
@@ -161,11 +268,9 @@ class Game:
                 pygame.draw.rect(surface, color, rect)
             for i in range(4):
                 piece = pieces[i]
-                piece.set_texture()
-                img = pygame.image.load(piece.texture)
+                img = self.sprites.get(piece, size=80)
                 piece_center = squares[i][1] * SQSIZE + SQSIZE // 2, squares[i][0] * SQSIZE + SQSIZE // 2
-                piece.texture_square = img.get_rect(center=piece_center)
-                surface.blit(img, piece.texture_square)
+                surface.blit(img, img.get_rect(center=piece_center))
 
     # other methods
 
@@ -173,10 +278,82 @@ class Game:
         self.next_player = 'white' if self.next_player == 'black' else 'black'
 
     def set_hover(self, row, col):
+        if self.hovered_sqr is not None:
+            if self.hovered_sqr.row == row and self.hovered_sqr.col == col:
+                return
+            self.mark_dirty(self.hovered_sqr.row, self.hovered_sqr.col)
         self.hovered_sqr = self.board.squares[row][col]
+        self.mark_dirty(row, col)
+
+    # takes back one ply, returns False at the start of the game
+    def undo(self) -> bool:
+        if not self.history.undo():
+            return False
+        self.moves.pop(-1)
+        self._after_history_step()
+        return True
+
+    # plays an undone ply again, returns False if there is none
+    def redo(self) -> bool:
+        if not self.history.redo():
+            return False
+        self.moves.append(self.board.last_move)
+        self._after_history_step()
+        return True
+
+    # goes to the position after the given number of plies
+    def jump(self, ply):
+        self.history.jump(ply)
+        self.moves = [self.board.code_to_move(code) for code in self.history.codes[:self.history.ply]]
+        self._after_history_step()
+
+    # the side to move, the end of the game and the drawing follow the board
+    def _after_history_step(self):
+        board = self.board
+        self.next_player = board.turn
+        self.promoting = False
+        if board.legal_codes():
+            board.checkmate = False
+            board.stalemate = False
+        else:
+            board.checkmate = board.position.in_check(board.position.turn)
+            board.stalemate = not board.checkmate
+        self.game_over = board.checkmate or board.stalemate
+        self.mark_all_dirty()
 
     def change_theme(self):
         self.config.change_theme()
+        self.mark_all_dirty()
+
+    # the game so far as PGN text
+    def to_pgn(self, headers=None) -> str:
+        '''
+        :param headers: extra tags such as Event or White
+        :return: PGN with SAN moves, starting from a FEN tag if the game did not start from the initial position
+        '''
+        fen, moves = self.history.san_moves()
+        if self.board.checkmate:
+            result = '0-1' if self.board.turn == 'white' else '1-0'
+        elif self.board.stalemate:
+            result = '1/2-1/2'
+        else:
+            result = '*'
+        out = io.StringIO()
+        tags = {'Event': 'Casual game', 'Site': 'local', 'Date': datetime.date.today().strftime('%Y.%m.%d'),
+                'White': 'Player' if self.player['white'] else 'AI',
+                'Black': 'Player' if self.player['black'] else 'AI'}
+        tags.update(headers or {})
+        pgn.write_game(out, tags, moves, result, None if fen == START_FEN else fen)
+        return out.getvalue()
+
+    # appends the game to a PGN file
+    def save_pgn(self, path='game.pgn', headers=None):
+        with open(path, 'a') as file:
+            file.write(self.to_pgn(headers))
+
+    # board observer, plays the sound of a move
+    def on_move(self, undo):
+        self.play_sound(undo.captured is not None)
 
     def play_sound(self, captured=False):
         if captured:
@@ -185,4 +362,5 @@ class Game:
             self.config.move_sound.play()
 
     def reset(self):
-        self.__init__()
+        # loaded images survive a restart
+        self.__init__(self.sprites)
@@ -0,0 +1,137 @@
+from array import array
+
+from bitboard import Position
+from const import *
+import pgn
+
+
+class GameHistory:
+    '''
+    Every ply of a game with undo, redo and jumps to any ply.
+
+    Each ply is kept as its encoded move (4 bytes, flags and promotion
+    included). Undo takes back the board's own undo record in O(1), redo
+    makes the recorded move again, and a move played after an undo drops the
+    plies that were undone. The board keeps undo records for the last
+    undo_limit plies only; older plies, and long jumps, are reached from a
+    FEN snapshot taken every snapshot_every plies and replayed from there,
+    far enough back that repetitions are still seen.
+
+        history = GameHistory(board)
+        board.add_observer(history.on_move)
+        history.undo()
+        history.redo()
+        history.jump(0)
+    '''
+
+    def __init__(self, board, snapshot_every=HISTORY_SNAPSHOT_EVERY, undo_limit=HISTORY_UNDO_LIMIT):
+        '''
+        :param board: Board the game is played on, in the position the game starts from
+        :param snapshot_every: plies between two FEN snapshots
+        :param undo_limit: plies of undo records the board keeps, at least HISTORY_REPETITION_PLIES
+        '''
+        self.board = board
+        self.snapshot_every = snapshot_every
+        self.undo_limit = max(undo_limit, HISTORY_REPETITION_PLIES)
+        self.start_fen = board.to_fen()
+        # encoded moves of every ply, the ones after self.ply can be redone
+        self.codes = array('I')
+        self.ply = 0
+        # FEN by ply
+        self.snapshots = {0: self.start_fen}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def can_undo(self) -> bool:
+        return self.ply > 0
+
+    def can_redo(self) -> bool:
+        return self.ply < len(self.codes)
+
+    # board observer, records a move just played
+    def on_move(self, undo):
+        del self.codes[self.ply:]
+        for ply in [ply for ply in self.snapshots if ply > self.ply]:
+            del self.snapshots[ply]
+        self.codes.append(self.board.position.stack[-1][0])
+        self._advance()
+
+    # records the piece a pawn was just promoted to, see Board.promote
+    def amend_last(self):
+        if self.ply:
+            self.codes[self.ply - 1] = self.board.position.stack[-1][0]
+            if self.ply in self.snapshots:
+                self.snapshots[self.ply] = self.board.to_fen()
+
+    # takes back one ply, returns False at the start of the game
+    def undo(self) -> bool:
+        if not self.ply:
+            return False
+        if len(self.board.undo_stack) > min(self.ply - 1, HISTORY_REPETITION_PLIES):
+            self.board.unmake_move()
+            self.board.clear_moves()
+            self.ply -= 1
+        else:
+            # too few undo records would be left to see repetitions, the board is set up again
+            self.jump(self.ply - 1)
+        return True
+
+    # plays an undone ply again, returns False if there is none
+    def redo(self) -> bool:
+        if self.ply == len(self.codes):
+            return False
+        board = self.board
+        board.make_move(board.code_to_move(self.codes[self.ply]))
+        board.clear_moves()
+        self._advance()
+        return True
+
+    # goes to the position after the given number of plies
+    def jump(self, ply):
+        '''
+        The board keeps undo records of at least HISTORY_REPETITION_PLIES plies
+        before the target, so repetitions are still seen.
+        :param ply: 0 for the start position up to len(self) for the last ply played
+        '''
+        ply = max(0, min(ply, len(self.codes)))
+        reachable = self.ply - len(self.board.undo_stack)
+        # walk while enough undo records are left before the ply and it isn't much further ahead
+        if reachable <= ply - min(ply, HISTORY_REPETITION_PLIES) and ply <= self.ply + self.undo_limit:
+            while self.ply > ply:
+                self.undo()
+            while self.ply < ply:
+                self.redo()
+            return
+
+        # replay from the latest snapshot at least undo_limit plies before the ply
+        start = (max(ply - self.undo_limit, 0) // self.snapshot_every) * self.snapshot_every
+        board = self.board
+        board.set_fen(self.snapshots[start])
+        for code in self.codes[start:ply]:
+            board.make_move(board.code_to_move(code))
+        self.ply = ply
+        self._trim()
+
+    # start FEN and SAN moves of the plies played up to the current one
+    def san_moves(self):
+        position = Position.from_fen(self.start_fen)
+        moves = []
+        for code in self.codes[:self.ply]:
+            moves.append(pgn.move_to_san(position, code))
+            position.make(code)
+        return self.start_fen, moves
+
+    def _advance(self):
+        self.ply += 1
+        if not self.ply % self.snapshot_every and self.ply not in self.snapshots:
+            self.snapshots[self.ply] = self.board.to_fen()
+        self._trim()
+
+    # drops the oldest undo records of the board, a block at a time
+    def _trim(self):
+        board = self.board
+        extra = len(board.undo_stack) - self.undo_limit
+        if extra >= self.undo_limit:
+            del board.undo_stack[:extra]
+            del board.position.stack[:extra]
@@ -5,6 +5,8 @@ import sys
 
 from const import *
 from game import Game
+from ai_worker import AIWorker
+import book
 from square import Square
 from move import Move
 from piece import *
@@ -17,6 +19,12 @@ class Main:
         self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
         pygame.display.set_caption('Chess')
         self.game = Game()
+        # AI searches run in a background thread
+        self.ai_worker = AIWorker()
+        self.ai_job = None
+        self.ai_progress_depth = 0
+        # opening book, None if there is no book file
+        self.book = book.load(BOOK_PATH)
 
     # shows promotion options, collects a choice and promotes
     def promote(self):
@@ -26,6 +34,11 @@ class Main:
         board = self.game.board
         dragger = self.game.dragger
 
+        # the choices have to be on screen before waiting for a click
+        game.show_all(screen, show_promotion=False)
+        game.show_promotion(screen)
+        pygame.display.update()
+
         run = True
         while run:
             for e in pygame.event.get():
@@ -50,19 +63,19 @@ class Main:
                     for i in range(4):
                         if squares[i] == (clicked_row, clicked_col):
                             # assign a piece
-                            board.squares[final.row][final.col].piece = pieces[i]
+                            board.promote(final.row, final.col, pieces[i])
+                            game.history.amend_last()
                             # exit promoting
                             run = False
                             game.promoting = False
                             # show
-                            game.show_all(screen)
+                            game.mark_all_dirty()
 
     # human play methods
 
     # registers player's click
     def player_click(self, event: pygame.event.Event):
         # variables' initialisation
-        screen = self.screen
         game = self.game
         board = self.game.board
         dragger = self.game.dragger
@@ -86,13 +99,13 @@ class Main:
                     board.calc_moves(piece, clicked_row, clicked_col, check=True)
                 dragger.save_initial(event.pos)
                 dragger.drag_piece(piece)
-                # show methods
-                game.show_all(screen, show_hover=False)
+                # redraw the piece's square, its moves and the piece under the mouse
+                game.mark_moves_dirty(piece, clicked_row, clicked_col)
+                game.mark_rect_dirty(dragger.get_rect())
 
     # registers player's dragging piece
     def player_drag(self, event: pygame.event.Event):
         # variables' initialisation
-        screen = self.screen
         game = self.game
         board = self.game.board
         dragger = self.game.dragger
@@ -105,21 +118,22 @@ class Main:
         # puts hover onto it
         game.set_hover(motion_row, motion_col)
 
-        # updates everything
+        # redraws where the dragged piece was and where it is now
         if dragger.dragging:
+            game.mark_rect_dirty(dragger.get_rect())
             dragger.update_mouse(event.pos)
-            # show methods
-            game.show_all(screen)
-            dragger.update_blit(screen)
+            game.mark_rect_dirty(dragger.get_rect())
 
     # registers if dragged piece is released
     def player_release(self, event: pygame.event.Event):
-        screen = self.screen
         game = self.game
         board = self.game.board
         dragger = self.game.dragger
 
         if dragger.dragging:
+            # the dragged piece and the move highlights disappear
+            game.mark_rect_dirty(dragger.get_rect())
+            game.mark_moves_dirty(dragger.piece, dragger.initial_row, dragger.initial_col)
             dragger.update_mouse(event.pos)
 
             released_row = min(WIDTH - 1, max(0, dragger.mouseY)) // SQSIZE
@@ -133,8 +147,6 @@ class Main:
             final = Square(released_row, released_col)
             # if move wasn't done to avoid clicking to much
             if initial == final:
-                # show
-                game.show_all(screen)
                 dragger.undrag_piece()
                 # if click is in the same position no need to re-calculate moves
                 return
@@ -142,14 +154,10 @@ class Main:
 
             # valid move ?
             if board.valid_move(dragger.piece, move):
-                # normal capture
-                captured = board.squares[released_row][released_col].has_piece()
-                changed_squares = board.move(dragger.piece, move)
-                game.changed_squares.append(changed_squares)
+                # move piece, the game plays its sound
+                board.move(dragger.piece, move)
                 game.moves.append(move)
 
-                board.set_true_en_passant(dragger.piece)
-
                 if board.check_promotion(dragger.piece, final):
                     game.promoting = True
 
@@ -168,58 +176,87 @@ class Main:
                     board.checkmate = False
                     board.stalemate = False
 
-                # sounds
-                game.play_sound(captured)
-                # show methods
-                game.show_all(screen, show_moves=False, show_hover=False)
+                # a move changes several squares and the last move trace
+                game.mark_all_dirty()
                 # next turn
                 game.next_turn()
 
         dragger.undrag_piece()
-        '''
-        When a stops being dragged, it is still not shown, so we have to show everything again
-        '''
-        # show methods
-        game.show_all(screen)
-
-    # makes a move for AI
-    def make_ai_move(self):
+
+    # move of the opening book for the current position, None when out of book
+    def book_move(self):
+        if self.book is None:
+            return None
+        code = self.book.probe(self.game.board.position)
+        return self.game.board.code_to_move(code) if code else None
+
+    # makes a move for AI, searching at most time_ms milliseconds in this thread
+    def make_ai_move(self, time_ms=AI_TIME_MS):
+        # book moves are played without a search
+        move = self.book_move()
+        if move is None:
+            # gets the best move found within the time budget
+            move = self.game.ai_engine.search(self.game.board, time_ms=time_ms)
+        self.play_ai_move(move)
+
+    # starts an AI search in the worker thread, the loop keeps running meanwhile
+    def start_ai_move(self, time_ms=AI_TIME_MS):
+        # book moves are played right away
+        move = self.book_move()
+        if move is not None:
+            self.play_ai_move(move)
+            return
+        self.ai_job = self.ai_worker.submit(self.game.board, time_ms=time_ms)
+        self.ai_progress_depth = 0
+
+    # plays the move of a finished AI search, returns True once it is played
+    def finish_ai_move(self):
+        job = self.ai_job
+        if job is None or not job.done():
+            return False
+        self.ai_job = None
+        if job.cancelled or not job.result:
+            return False
+        pygame.display.set_caption('Chess')
+        self.play_ai_move(self.game.board.code_to_move(job.result))
+        return True
+
+    # shows the best move found so far in the window caption
+    def show_ai_progress(self):
+        job = self.ai_job
+        if job is not None and job.depth and job.depth != self.ai_progress_depth:
+            self.ai_progress_depth = job.depth
+            pygame.display.set_caption(
+                f'Chess - thinking: depth {job.depth}, best {self.game.board.code_to_move(job.best)}')
+
+    # drops a running AI search, e.g. when its position is undone
+    def cancel_ai_move(self):
+        if self.ai_job is not None:
+            self.ai_worker.cancel()
+            self.ai_job = None
+            pygame.display.set_caption('Chess')
+
+    # plays a move chosen by the AI
+    def play_ai_move(self, move):
         # initialize everything necessary
-        screen = self.screen
         game = self.game
         board = self.game.board
         ai_engine = self.game.ai_engine
 
-        # calculates valid moves for engine
-        ai_engine.get_valid_moves(board, game.next_player)
-
-        # gets best move, which is now just a random move
-        player_coefficient = 1 if game.next_player == 'white' else -1
-        move = ai_engine.get_best_move(board, player_coefficient)
-
         # save move info
         initial = move.initial
         final = move.final
         piece = board.squares[initial.row][initial.col].piece
 
-        # normal capture
-        captured = board.squares[final.row][final.col].has_piece()
-
-        # move piece
-        changed_squares = board.move(piece, move, testing=False)
+        # move piece, the game plays its sound
+        board.move(piece, move, testing=False)
 
         # clear engine moves
         ai_engine.clear()
 
         # change move log
-        game.changed_squares.append(changed_squares)
         game.moves.append(move)
 
-        board.set_true_en_passant(piece)
-
-        if board.check_promotion(piece, final):
-            board.squares[final.row][final.col] = Queen(piece.color)
-
         # checkmate and stalemate
         if not board.moves_left(game.next_player):
             game.game_over = True
@@ -233,10 +270,8 @@ class Main:
             board.checkmate = False
             board.stalemate = False
 
-        # sounds
-        game.play_sound(captured)
-        # show methods
-        game.show_all(screen, show_moves=False, show_hover=False)
+        # a move changes several squares and the last move trace
+        game.mark_all_dirty()
         # next turn
         game.next_turn()
 
@@ -247,37 +282,39 @@ class Main:
         board = self.game.board
         dragger = self.game.dragger
         ai_engine = self.game.ai_engine
+        clock = pygame.time.Clock()
 
         while True:
-            # show methods
-            game.show_all(screen, show_promotion=False)
+            # show methods, only what changed since the last frame
+            rects = game.render(screen)
 
-            # shows a message if checkmate on the board
-            if board.checkmate:
+            # texts go on top of a full redraw
+            if rects:
+                # shows a message if checkmate on the board
+                if board.checkmate:
 
-                last_square = board.last_move.final
-                color = board.squares[last_square.row][last_square.col].piece.color
-                text = color + ' wins by checkmate. Press r to restart'
-                game.show_text(screen, text)
+                    last_square = board.last_move.final
+                    color = board.squares[last_square.row][last_square.col].piece.color
+                    text = color + ' wins by checkmate. Press r to restart'
+                    rects.append(game.show_text(screen, text))
 
-            # shows a message if stalemate on the board
-            elif board.stalemate:
+                # shows a message if stalemate on the board
+                elif board.stalemate:
 
-                text = 'game ended with stalemate. Press r to restart'
-                game.show_text(screen, text)
+                    text = 'game ended with stalemate. Press r to restart'
+                    rects.append(game.show_text(screen, text))
 
             # starts promoting if pawn is promoting
             if game.promoting:
-                game.show_promotion(screen)
                 self.promote()
 
-            if dragger.dragging:
-                dragger.update_blit(screen)
-
-            # makes AI move if it's AI's turn
+            # makes AI move if it's AI's turn, the search runs in the background
             if not game.game_over:
                 if not game.player[game.next_player]:
-                    self.make_ai_move()
+                    if self.ai_job is None:
+                        self.start_ai_move()
+                    elif not self.finish_ai_move():
+                        self.show_ai_progress()
 
             for event in pygame.event.get():
 
@@ -310,17 +347,28 @@ class Main:
 
                     # unmoving
                     if event.key == pygame.K_z:
-                        if len(game.moves) > 0 and not dragger.dragging:
-                            # if move undone, no checkmate or stalemate
-                            board.checkmate = False
-                            board.stalemate = False
-                            # undoes move and removes last move from move log
-                            board.undo_move(game.changed_squares.pop(-1))
-                            game.moves.pop(-1)
-                            # show methods
-                            game.show_all(screen, show_hover=False, show_moves=False)
-                            # switch turns back
-                            game.next_turn()
+                        if game.history.can_undo() and not dragger.dragging:
+                            # the AI may be thinking about the position being undone
+                            self.cancel_ai_move()
+                            # undoes the move, the side to move and the end of the game follow
+                            game.undo()
+
+                    # redoing an undone move
+                    elif event.key == pygame.K_y:
+                        if game.history.can_redo() and not dragger.dragging:
+                            self.cancel_ai_move()
+                            game.redo()
+
+                    # start and end of the game
+                    elif event.key in (pygame.K_HOME, pygame.K_END):
+                        if not dragger.dragging:
+                            self.cancel_ai_move()
+                            game.jump(0 if event.key == pygame.K_HOME else len(game.history))
+
+                    # saves the game so far
+                    elif event.key == pygame.K_s:
+                        game.save_pgn()
+                        print('game saved to game.pgn')
 
                     # changing themes
                     elif event.key == pygame.K_t:
@@ -329,6 +377,7 @@ class Main:
                     # resets the game
                     elif event.key == pygame.K_r:
                         if not dragger.dragging:
+                            self.cancel_ai_move()
                             # save a theme
                             theme = game.config.theme
                             # reset game
@@ -340,12 +389,20 @@ class Main:
                             board = self.game.board
                             dragger = self.game.dragger
 
+                # window uncovered, its content has to be drawn again
+                elif event.type == pygame.VIDEOEXPOSE:
+                    game.mark_all_dirty()
+
                 # quit application
                 elif event.type == pygame.QUIT:
+                    self.ai_worker.close()
                     pygame.quit()
                     sys.exit()
 
-            pygame.display.update()
+            # nothing is drawn while idle, the clock keeps the loop from spinning
+            if rects:
+                pygame.display.update(rects)
+            clock.tick(FPS)
 
 
 main = Main()
@@ -1,9 +1,12 @@
 class Move:
+    __slots__ = ('initial', 'final', 'promotion')
 
-    def __init__(self, initial, final):
+    def __init__(self, initial, final, promotion=None):
         # initial and final are squares
         self.initial = initial
         self.final = final
+        # name of the piece a pawn promotes to, None means a queen
+        self.promotion = promotion
 
     def __str__(self):
         s = ''
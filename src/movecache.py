@@ -0,0 +1,46 @@
+from collections import OrderedDict
+
+from const import *
+
+
+class MoveCache:
+    '''
+    Legal moves of recently seen positions, keyed by Zobrist key.
+
+    The key covers the pieces, the side to move, castling rights and the en
+    passant square, so a made, unmade or promoted move simply looks up
+    another entry and nothing has to be invalidated. The least recently used
+    positions are dropped once the cache is full.
+    '''
+
+    def __init__(self, capacity=MOVE_CACHE_SIZE):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        # statistics
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # encoded legal moves of the side to move, generated once per position
+    def legal_moves(self, position) -> tuple:
+        '''
+        :param position: bitboard Position
+        :return: tuple of encoded moves, shared between callers so it is never changed
+        '''
+        key = position.key
+        moves = self.entries.get(key)
+        if moves is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return moves
+        self.misses += 1
+        moves = tuple(position.legal_moves())
+        self.entries[key] = moves
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return moves
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,169 @@
+'''
+Move ordering for the alpha-beta search.
+
+MovePicker hands out the legal moves of a position in the order most likely
+to cause a cutoff, generating them in stages:
+
+    1. the hash move of the transposition table
+    2. captures and promotions, most valuable victim / least valuable attacker first
+    3. the two killer moves of the ply, quiet moves that caused a cutoff in a sibling
+    4. the remaining quiet moves, best history score first
+
+Each stage is only generated once the previous one is used up, so a cutoff
+by the hash move or a capture never generates the quiet moves.
+
+see() is the static exchange evaluation of a capture, used by the quiescence
+search to skip captures that lose material.
+'''
+from bitboard import GEN_CAPTURES, GEN_QUIETS, FLAG_CAPTURE, FLAG_EN_PASSANT, PAWN, KING
+from const import PIECE_VALUES
+
+
+# MVV-LVA score of a capture or promotion, higher is searched first
+def capture_score(position, move) -> int:
+    frm = move & 63
+    victim = PAWN if move & FLAG_EN_PASSANT else position.board[(move >> 6) & 63] % 6
+    score = 0
+    if move & FLAG_CAPTURE:
+        score = PIECE_VALUES[victim] * 16 - PIECE_VALUES[position.board[frm] % 6]
+    promo = (move >> 12) & 7
+    if promo:
+        score += PIECE_VALUES[promo] * 16
+    return score
+
+
+# material won by a capture when both sides recapture on its square with their least valuable piece
+def see(position, move) -> int:
+    '''
+    Attackers behind a piece that has captured (x-rays) join in as the
+    occupancy is thinned out. Either side may stop capturing when it would
+    lose material, and a king only captures onto an undefended square.
+    :param position: bitboard Position before the move
+    :param move: encoded capture or promotion of the side to move
+    :return: centipawns won by the side to move, negative if the capture loses material
+    '''
+    frm = move & 63
+    to = (move >> 6) & 63
+    board = position.board
+    pieces = position.pieces
+    occupied = position.occupied
+    occ = (occupied[0] | occupied[1]) ^ (1 << frm)
+
+    if move & FLAG_EN_PASSANT:
+        occ ^= 1 << (to - 8 if position.turn == 0 else to + 8)
+        gain = [PIECE_VALUES[PAWN]]
+    elif move & FLAG_CAPTURE:
+        gain = [PIECE_VALUES[board[to] % 6]]
+    else:
+        gain = [0]
+    # value of the piece standing on the square, the next one to be captured
+    promo = (move >> 12) & 7
+    if promo:
+        gain[0] += PIECE_VALUES[promo] - PIECE_VALUES[PAWN]
+        on_square = PIECE_VALUES[promo]
+    else:
+        on_square = PIECE_VALUES[board[frm] % 6]
+
+    side = position.turn ^ 1
+    attackers = position.attackers_to(to, occ) & occ
+    while True:
+        own = attackers & occupied[side]
+        if not own:
+            break
+        for ptype in range(6):
+            bb = own & pieces[side][ptype]
+            if bb:
+                break
+        # the king can't capture onto a defended square
+        if ptype == KING and attackers & occupied[side ^ 1]:
+            break
+        gain.append(on_square - gain[-1])
+        on_square = PIECE_VALUES[ptype]
+        occ ^= bb & -bb
+        # sliders behind the capturing piece now see the square
+        attackers = position.attackers_to(to, occ) & occ
+        side ^= 1
+
+    # each side picks the better of capturing and standing pat, from the last capture back
+    for i in range(len(gain) - 1, 0, -1):
+        gain[i - 1] = -max(-gain[i - 1], gain[i])
+    return gain[0]
+
+
+# whether a move from the table or a killer slot is legal in the position
+def is_legal(position, move) -> bool:
+    return move in position.legal_moves(from_mask=1 << (move & 63))
+
+
+# a quiet move is neither a capture nor a promotion
+def is_quiet(move) -> bool:
+    return not move & FLAG_CAPTURE and not (move >> 12) & 7
+
+
+# sorts a list of encoded moves in place: captures by MVV-LVA, then the quiet moves
+def order_moves(position, moves, history=None):
+    '''
+    :param moves: encoded legal moves of the side to move
+    :param history: from * 64 + to scores of quiet moves, see MovePicker
+    :return: the same list
+    '''
+    def key(move):
+        if not is_quiet(move):
+            return -capture_score(position, move) - (1 << 20)
+        return -history[move & 4095] if history is not None else 0
+    moves.sort(key=key)
+    return moves
+
+
+class MovePicker:
+    '''
+    Iterates the legal moves of a position in stages. The position may be
+    changed between two moves as long as it is restored before the next one.
+    '''
+
+    def __init__(self, position, hash_move=0, killers=(), history=None, captures=None, quiets=None):
+        '''
+        :param position: bitboard Position
+        :param hash_move: move of the transposition table or the principal variation, 0 for none
+        :param killers: quiet moves that caused a cutoff at the same ply
+        :param history: list of 4096 scores of quiet moves indexed by from * 64 + to
+        :param captures: list to generate the captures into, e.g. a buffer kept per search ply
+        :param quiets: list to generate the quiet moves into
+        '''
+        self.position = position
+        self.hash_move = hash_move
+        self.killers = killers
+        self.history = history
+        self.captures = captures if captures is not None else []
+        self.quiets = quiets if quiets is not None else []
+
+    def __iter__(self):
+        position = self.position
+        hash_move = self.hash_move
+        if hash_move and is_legal(position, hash_move):
+            yield hash_move
+        else:
+            hash_move = 0
+
+        # captures and promotions, most valuable victim first
+        captures = position.legal_moves(moves=self.captures, gen=GEN_CAPTURES)
+        if len(captures) > 1:
+            captures.sort(key=lambda move: capture_score(position, move), reverse=True)
+        for move in captures:
+            if move != hash_move:
+                yield move
+
+        tried = [hash_move]
+        for killer in self.killers:
+            if killer and killer not in tried and is_quiet(killer) and is_legal(position, killer):
+                tried.append(killer)
+                yield killer
+
+        # remaining quiet moves by history score
+        quiets = position.legal_moves(moves=self.quiets, gen=GEN_QUIETS)
+        history = self.history
+        if history is not None and len(quiets) > 1:
+            quiets.sort(key=lambda move: history[move & 4095], reverse=True)
+        for move in quiets:
+            if move not in tried:
+                yield move
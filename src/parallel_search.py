@@ -0,0 +1,180 @@
+'''
+Parallel root search: the root moves are dealt out to a pool of worker processes,
+each searching its share with iterative deepening. The workers share one
+transposition table kept in shared memory, so results found by one of them
+order and cut the search of the others.
+
+    python parallel_search.py --depth 4 --workers 4       # speedup against one core
+'''
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from ai_chess import AI_engine
+from bitboard import Position, move_name
+from board import Board
+from move import Move
+from transposition import TranspositionTable
+from const import *
+
+# engine of a worker process, set up once by _init_worker
+_engine = None
+
+
+# attaches a worker process to the shared transposition table
+def _init_worker(tt_name, tt_mb):
+    global _engine
+    # keep a reference so the mapping lives as long as the process
+    shm = shared_memory.SharedMemory(name=tt_name)
+    _engine = AI_engine(TranspositionTable(tt_mb, shm.buf))
+    _engine.shm = shm
+
+
+# searches one share of the root moves, returns ([(depth, score, best move), ...], nodes)
+def _search_worker(position, root_moves, max_depth, time_ms):
+    '''
+    :return: finished iterations and the nodes of the whole search, an interrupted last iteration included
+    '''
+    iterations = []
+
+    def progress(engine):
+        iterations.append((engine.depth, engine.score, engine.pv[0]))
+
+    _engine.search_position(position, max_depth, time_ms, progress, root_moves)
+    return iterations, _engine.nodes
+
+
+class ParallelSearch:
+    '''
+    Root-split search over a process pool with a shared transposition table.
+
+        search = ParallelSearch(workers=4)
+        move = search.search(board, time_ms=1000)
+        search.close()
+
+    Every worker searches its root moves with a full window, so the scores of
+    one depth are exact and can be compared across workers. The pay-off is
+    less pruning than a single alpha-beta search over all root moves.
+    '''
+
+    def __init__(self, workers=None, tt_mb=TT_SIZE_MB):
+        '''
+        :param workers: number of processes, one per core by default
+        :param tt_mb: size of the shared transposition table in megabytes
+        '''
+        self.workers = workers or os.cpu_count() or 1
+        self.tt_mb = tt_mb
+        self.shm = shared_memory.SharedMemory(create=True, size=TranspositionTable.table_bytes(tt_mb))
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.shm.name, tt_mb))
+        self.futures = []
+        # results of the last search
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.best = 0
+
+    # searches for the best move, same interface as AI_engine.search
+    def search(self, board: Board, max_depth=MAX_SEARCH_DEPTH, time_ms=None) -> Move:
+        code = self.search_position(board.position, max_depth, time_ms)
+        return board.code_to_move(code) if code else None
+
+    # same search on a bare bitboard position, returns an encoded move or 0
+    def search_position(self, position, max_depth=MAX_SEARCH_DEPTH, time_ms=None) -> int:
+        '''
+        :param position: bitboard Position, left unchanged
+        :param max_depth: deepest iteration in plies
+        :param time_ms: time budget in milliseconds for every worker, None for no limit
+        :return: best encoded move of the deepest depth every worker finished, 0 if there are no moves
+        '''
+        moves = position.legal_moves()
+        self.nodes = self.depth = self.score = self.best = 0
+        if not moves:
+            return 0
+
+        # deal the moves round-robin, the generator's order spreads captures and quiet moves
+        shares = [moves[i::self.workers] for i in range(min(self.workers, len(moves)))]
+        self.futures = [self.pool.submit(_search_worker, position, share, max_depth, time_ms) for share in shares]
+        results = [future.result() for future in self.futures]
+        self.futures = []
+
+        # every node each worker searched, as the single-process search counts them
+        self.nodes = sum(nodes for _, nodes in results)
+        finished = [iterations for iterations, _ in results if iterations]
+        if not finished:
+            # nobody finished a single iteration
+            self.best = moves[0]
+            return self.best
+
+        # only scores of the same depth are comparable, a worker that found a mate stopped early
+        unfinished = [iterations[-1][0] for iterations in finished
+                      if abs(iterations[-1][1]) < MATE_BOUND]
+        depth = min(unfinished) if unfinished else max(iterations[-1][0] for iterations in finished)
+        for iterations in finished:
+            _, score, best = iterations[min(depth, len(iterations)) - 1]
+            if not self.best or score > self.score:
+                self.depth, self.score, self.best = depth, score, best
+        return self.best
+
+    # zeroes the shared transposition table
+    def clear(self):
+        self.shm.buf[:] = bytes(self.shm.size)
+
+    # shuts the pool down and frees the shared memory
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+        self.shm.close()
+        self.shm.unlink()
+
+
+# times a fixed-depth search on one core and on the pool, returns the statistics
+def benchmark(position, depth, workers=None, tt_mb=TT_SIZE_MB) -> dict:
+    engine = AI_engine(TranspositionTable(tt_mb))
+    start = time.perf_counter()
+    single_move = engine.search_position(position, depth)
+    single_time = time.perf_counter() - start
+
+    search = ParallelSearch(workers, tt_mb)
+    try:
+        # start the pool before timing
+        search.pool.submit(int).result()
+        start = time.perf_counter()
+        parallel_move = search.search_position(position, depth)
+        parallel_time = time.perf_counter() - start
+    finally:
+        search.close()
+
+    return {
+        'workers': search.workers,
+        'depth': depth,
+        'single_time': single_time,
+        'single_nodes': engine.nodes,
+        'single_move': single_move,
+        'parallel_time': parallel_time,
+        'parallel_nodes': search.nodes,
+        'parallel_move': parallel_move,
+        'speedup': single_time / parallel_time if parallel_time else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='parallel root search speedup against one core')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, one per core by default')
+    parser.add_argument('--depth', type=int, default=4, help='search depth in plies')
+    parser.add_argument('--fen', help='position to search, the start position by default')
+    args = parser.parse_args(argv)
+
+    position = Position.from_fen(args.fen) if args.fen else Position.start()
+    result = benchmark(position, args.depth, args.workers)
+    print(f'1 core     {result["single_time"]:8.3f} s  {result["single_nodes"]:>10} nodes  '
+          f'best {move_name(result["single_move"])}')
+    print(f'{result["workers"]} workers  {result["parallel_time"]:8.3f} s  {result["parallel_nodes"]:>10} nodes  '
+          f'best {move_name(result["parallel_move"])}')
+    print(f'speedup {result["speedup"]:.2f}x')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
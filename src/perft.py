@@ -0,0 +1,160 @@
+'''
+Perft: counts the leaf nodes of the legal move tree to check and time move generation.
+
+    python perft.py                      # correctness suite up to depth 3, board copy and PGN checks
+    python perft.py --depth 4            # deeper suite
+    python perft.py --fen "<fen>" --depth 3 --divide
+'''
+import argparse
+import copy
+import io
+import pickle
+import sys
+import time
+
+from bitboard import Position, move_name
+from board import Board
+import pgn
+
+# (name, FEN, node counts for depth 1, 2, ...)
+PERFT_SUITE = [
+    ('start', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+     [20, 400, 8902, 197281, 4865609]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     [48, 2039, 97862, 4085603]),
+    ('en passant and pins', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     [14, 191, 2812, 43238, 674624]),
+    ('promotions', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     [6, 264, 9467, 422333]),
+    ('castling and promotion checks', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     [44, 1486, 62379, 2103487]),
+    ('middlegame', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     [46, 2079, 89890, 3894594]),
+]
+
+
+# counts leaf nodes depth plies below position
+def perft(position: Position, depth: int) -> int:
+    moves = position.legal_moves()
+    # bulk counting: the last ply only needs the number of moves
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        position.make(move)
+        nodes += perft(position, depth - 1)
+        position.unmake()
+    return nodes
+
+
+# perft split by root move, the usual way to find a move generation bug
+def divide(position: Position, depth: int) -> dict:
+    '''
+    :return: {move in coordinate notation: node count}
+    '''
+    result = {}
+    for move in position.legal_moves():
+        position.make(move)
+        result[move_name(move)] = perft(position, depth - 1)
+        position.unmake()
+    return result
+
+
+# runs perft on a FEN, returns (nodes, seconds)
+def timed_perft(fen: str, depth: int):
+    position = Position.from_fen(fen)
+    start = time.perf_counter()
+    nodes = perft(position, depth)
+    return nodes, time.perf_counter() - start
+
+
+# runs the suite up to max_depth, returns True if every count matched
+def run_suite(max_depth: int, out=sys.stdout) -> bool:
+    ok = True
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, counts in PERFT_SUITE:
+        for depth in range(1, min(max_depth, len(counts)) + 1):
+            nodes, seconds = timed_perft(fen, depth)
+            total_nodes += nodes
+            total_time += seconds
+            expected = counts[depth - 1]
+            status = 'ok' if nodes == expected else f'FAIL (expected {expected})'
+            ok = ok and nodes == expected
+            print(f'{name:<30} depth {depth}  {nodes:>10} nodes  {seconds:8.3f} s  '
+                  f'{nodes / seconds if seconds else 0:>10.0f} nps  {status}', file=out)
+    print(f'total {total_nodes} nodes in {total_time:.3f} s, '
+          f'{total_nodes / total_time if total_time else 0:.0f} nps', file=out)
+    return ok
+
+
+# checks that a board in play survives deepcopy and pickle, e.g. to be sent to a worker process
+def check_board_copies(fen=PERFT_SUITE[1][1], plies=4, out=sys.stdout) -> bool:
+    board = Board(fen)
+    for _ in range(plies):
+        board.make_move(board.code_to_move(board.legal_codes()[0]))
+    fen_after = board.to_fen()
+    ok = True
+    for name, clone in (('deepcopy', copy.deepcopy), ('pickle', lambda board: pickle.loads(pickle.dumps(board)))):
+        copied = clone(board)
+        # pieces of the copy keep the shared kinds
+        kinds_shared = all(a.piece is None or a.piece.kind is b.piece.kind
+                           for row_a, row_b in zip(board.squares, copied.squares) for a, b in zip(row_a, row_b))
+        same = copied.to_fen() == fen_after and sorted(copied.legal_codes()) == sorted(board.legal_codes())
+        # the copy's undo records take it back to the start without touching the original
+        for _ in range(plies):
+            copied.unmake_move()
+        undone = copied.to_fen() == Board(fen).to_fen() and board.to_fen() == fen_after
+        passed = kinds_shared and same and undone
+        ok = ok and passed
+        print(f'{"board " + name:<30} {"ok" if passed else "FAIL"}', file=out)
+    return ok
+
+
+# checks that castling written with zeros survives reading and replaying a PGN game
+def check_pgn_castling(out=sys.stdout) -> bool:
+    text = ('[Event "zero castling"]\n\n'
+            '1. e4 e5 2. Nf3 Nc6 3. Bc4 d6 4. 0-0 Be6 5. d3 Qd7 6. Nc3 0-0-0 7. a3 *\n')
+    expected = ['e4', 'e5', 'Nf3', 'Nc6', 'Bc4', 'd6', '0-0', 'Be6', 'd3', 'Qd7', 'Nc3', '0-0-0', 'a3']
+    try:
+        games = list(pgn.read_games(io.StringIO(text)))
+        position = None
+        for position, _ in games[0].replay():
+            pass
+        passed = len(games) == 1 and games[0].moves == expected and position is not None
+    except ValueError as error:
+        print(f'pgn zero castling: {error}', file=out)
+        passed = False
+    print(f'{"pgn zero castling":<30} {"ok" if passed else "FAIL"}', file=out)
+    return passed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='perft benchmark and move generation check')
+    parser.add_argument('--depth', type=int, default=3, help='search depth in plies')
+    parser.add_argument('--fen', help='position to count instead of the suite')
+    parser.add_argument('--divide', action='store_true', help='print node counts per root move')
+    args = parser.parse_args(argv)
+
+    if args.fen is None:
+        ok = run_suite(args.depth)
+        ok = check_board_copies() and ok
+        ok = check_pgn_castling() and ok
+        return 0 if ok else 1
+
+    position = Position.from_fen(args.fen)
+    start = time.perf_counter()
+    if args.divide:
+        result = divide(position, args.depth)
+        for name in sorted(result):
+            print(f'{name}: {result[name]}')
+        nodes = sum(result.values())
+    else:
+        nodes = perft(position, args.depth)
+    seconds = time.perf_counter() - start
+    print(f'nodes {nodes}  time {seconds:.3f} s  nps {nodes / seconds if seconds else 0:.0f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
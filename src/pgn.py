@@ -0,0 +1,286 @@
+'''
+SAN moves and streaming PGN files.
+
+    with open('archive.pgn') as file:
+        for game in read_games(file):           # one game in memory at a time
+            for position, move in game.replay():
+                ...
+
+    with open('out.pgn', 'w') as file:
+        write_game(file, {'White': 'me', 'Black': 'you'}, ['e4', 'e5', 'Nf3'], '*')
+'''
+import re
+
+from bitboard import Position, KNIGHT, BISHOP, ROOK, QUEEN, KING, PAWN, FLAG_CAPTURE, FLAG_CASTLE, square_name
+
+# SAN letters by piece type, pawns have none
+SAN_LETTERS = ('', 'N', 'B', 'R', 'Q', 'K')
+SAN_PIECES = {'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN, 'K': KING}
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+# tags every exported game starts with, in this order
+SEVEN_TAG_ROSTER = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+
+_SAN_RE = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+_TAG_RE = re.compile(r'^\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]\s*$')
+_MOVE_NUMBER_RE = re.compile(r'^\d+\.+')
+_UNESCAPE_RE = re.compile(r'\\(.)')
+_SPECIAL_RE = re.compile(r'[{}();]')
+
+
+# encodes a legal move of the side to move in SAN, e.g. Nbd2, exd6, e8=Q+, O-O
+def move_to_san(position: Position, move: int) -> str:
+    frm = move & 63
+    to = (move >> 6) & 63
+    promo = (move >> 12) & 7
+    ptype = position.board[frm] % 6
+
+    if move & FLAG_CASTLE:
+        san = 'O-O' if to > frm else 'O-O-O'
+    else:
+        capture = move & FLAG_CAPTURE
+        if ptype == PAWN:
+            san = square_name(frm)[0] + 'x' if capture else ''
+        else:
+            san = SAN_LETTERS[ptype]
+            # other pieces of the same type that can go to the same square
+            rivals = [m & 63 for m in position.legal_moves()
+                      if (m >> 6) & 63 == to and m & 63 != frm and position.board[m & 63] % 6 == ptype]
+            if rivals:
+                if all(sq & 7 != frm & 7 for sq in rivals):
+                    san += square_name(frm)[0]
+                elif all(sq >> 3 != frm >> 3 for sq in rivals):
+                    san += square_name(frm)[1]
+                else:
+                    san += square_name(frm)
+            if capture:
+                san += 'x'
+        san += square_name(to)
+        if promo:
+            san += '=' + SAN_LETTERS[promo]
+
+    position.make(move)
+    if position.in_check(position.turn):
+        san += '+' if position.has_legal_move() else '#'
+    position.unmake()
+    return san
+
+
+# decodes a SAN move of the side to move, raises ValueError if it is not a legal move
+def san_to_move(position: Position, san: str) -> int:
+    text = san.rstrip('+#!?')
+    moves = position.legal_moves()
+
+    if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        to = position.king_square(position.turn) + (2 if len(text) == 3 else -2)
+        for move in moves:
+            if move & FLAG_CASTLE and (move >> 6) & 63 == to:
+                return move
+        raise ValueError(f'illegal move: {san}')
+
+    match = _SAN_RE.match(text)
+    if match is None:
+        raise ValueError(f'invalid SAN move: {san}')
+    letter, from_file, from_rank, target, promotion = match.groups()
+    ptype = SAN_PIECES[letter] if letter else PAWN
+    to = (int(target[1]) - 1) * 8 + 'abcdefgh'.index(target[0])
+    promo = SAN_PIECES[promotion] if promotion else 0
+
+    found = []
+    for move in moves:
+        frm = move & 63
+        if (move >> 6) & 63 != to or (move >> 12) & 7 != promo or position.board[frm] % 6 != ptype:
+            continue
+        if from_file is not None and 'abcdefgh'[frm & 7] != from_file:
+            continue
+        if from_rank is not None and str((frm >> 3) + 1) != from_rank:
+            continue
+        found.append(move)
+    if len(found) != 1:
+        raise ValueError(f'{"ambiguous" if found else "illegal"} move: {san}')
+    return found[0]
+
+
+class PGNGame:
+    '''
+    One game of a PGN file: tags, SAN moves and result. Comments, variations
+    and NAGs are dropped while reading.
+    '''
+
+    def __init__(self, headers=None, moves=None, result='*'):
+        self.headers = headers if headers is not None else {}
+        self.moves = moves if moves is not None else []
+        self.result = result
+
+    # position the game starts from, the FEN tag if there is one
+    def start_position(self) -> Position:
+        fen = self.headers.get('FEN')
+        return Position.from_fen(fen) if fen else Position.start()
+
+    # plays the game through, yields (position before the move, encoded move)
+    def replay(self):
+        '''
+        The same Position object is yielded every time and the move is made
+        once the consumer asks for the next one, copy it to keep it.
+        Raises ValueError on an illegal move.
+        '''
+        position = self.start_position()
+        for san in self.moves:
+            move = san_to_move(position, san)
+            yield position, move
+            position.make(move)
+
+    # position after the last move
+    def end_position(self) -> Position:
+        position = self.start_position()
+        for san in self.moves:
+            position.make(san_to_move(position, san))
+        return position
+
+    def __str__(self):
+        return f'{self.headers.get("White", "?")} - {self.headers.get("Black", "?")} {self.result}'
+
+
+# splits movetext into tokens, dropping comments, variations and NAGs
+def _movetext_tokens(line, state):
+    '''
+    :param state: [brace comment open, variation depth], carried over lines
+    '''
+    i = 0
+    n = len(line)
+    while i < n:
+        char = line[i]
+        if state[0]:
+            end = line.find('}', i)
+            if end < 0:
+                return
+            state[0] = False
+            i = end + 1
+        elif char == '{':
+            state[0] = True
+            i += 1
+        elif char == ';':
+            return
+        elif char == '(':
+            state[1] += 1
+            i += 1
+        elif char == ')':
+            state[1] = max(0, state[1] - 1)
+            i += 1
+        elif char.isspace():
+            i += 1
+        else:
+            end = i
+            while end < n and not line[end].isspace() and line[end] not in '{}();':
+                end += 1
+            if not state[1]:
+                yield line[i:end]
+            i = end
+
+
+# reads games from a text file one at a time
+def read_games(file):
+    '''
+    :param file: text file or any iterable of lines
+    :return: generator of PGNGame, memory use is bounded by the largest game
+    '''
+    game = None
+    state = [False, 0]
+    in_movetext = False
+
+    for line in file:
+        # escaped lines are ignored
+        if line.startswith('%'):
+            continue
+        stripped = line.strip()
+
+        if not state[0] and not state[1] and stripped.startswith('['):
+            # tags after movetext start the next game
+            if game is not None and in_movetext:
+                yield game
+                game = None
+            if game is None:
+                game = PGNGame()
+                in_movetext = False
+            # a malformed tag is skipped rather than read as moves
+            match = _TAG_RE.match(stripped)
+            if match is not None:
+                game.headers[match.group(1)] = _UNESCAPE_RE.sub(r'\1', match.group(2))
+            continue
+
+        # most movetext lines have no comments or variations and just split
+        if state[0] or state[1] or _SPECIAL_RE.search(line):
+            tokens = _movetext_tokens(line, state)
+        else:
+            tokens = line.split()
+        for token in tokens:
+            if game is None:
+                game = PGNGame()
+            in_movetext = True
+            if token.startswith('$'):
+                continue
+            if token in RESULTS:
+                game.result = token
+                yield game
+                game = None
+                in_movetext = False
+                state = [False, 0]
+                continue
+            # move numbers may be glued to the move: 1.e4 or 12...Nf6
+            token = _MOVE_NUMBER_RE.sub('', token)
+            if token:
+                game.moves.append(token)
+
+    if game is not None and (game.moves or game.headers):
+        yield game
+
+
+# writes one game, long movetext is wrapped at 80 columns
+def write_game(out, headers, moves, result='*', fen=None):
+    '''
+    :param out: text file
+    :param headers: dict of tags, the seven tag roster is filled in with '?'
+    :param moves: SAN moves
+    :param result: 1-0, 0-1, 1/2-1/2 or *
+    :param fen: start position if not the standard one, black to move is numbered 1...
+    '''
+    headers = dict(headers)
+    headers['Result'] = result
+    if fen is not None:
+        headers['SetUp'] = '1'
+        headers['FEN'] = fen
+    for name in SEVEN_TAG_ROSTER:
+        out.write(f'[{name} "{_escape(headers.get(name, "?"))}"]\n')
+    for name, value in headers.items():
+        if name not in SEVEN_TAG_ROSTER:
+            out.write(f'[{name} "{_escape(value)}"]\n')
+    out.write('\n')
+
+    # move numbers continue from the FEN
+    fields = headers.get('FEN', '').split()
+    number = int(fields[5]) if len(fields) > 5 else 1
+    black = len(fields) > 1 and fields[1] == 'b'
+    tokens = []
+    for i, san in enumerate(moves):
+        if not black:
+            tokens.append(f'{number}.')
+        elif i == 0:
+            tokens.append(f'{number}...')
+        tokens.append(san)
+        if black:
+            number += 1
+        black = not black
+    tokens.append(result)
+
+    line = ''
+    for token in tokens:
+        if line and len(line) + len(token) >= 80:
+            out.write(line.rstrip() + '\n')
+            line = ''
+        line += token + ' '
+    out.write(line.rstrip() + '\n\n')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
@@ -1,22 +1,71 @@
-import os
+class PieceKind:
+    '''
+    Immutable data shared by every piece of one type and color, see PIECE_KINDS.
+    '''
+    __slots__ = ('name', 'color', 'value', 'dir')
+
+    def __init__(self, name, color, value):
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'color', color)
+        value_sign = 1 if color == 'white' else -1
+        object.__setattr__(self, 'value', value * value_sign)
+        # pawn direction in board rows
+        object.__setattr__(self, 'dir', -1 if color == 'white' else 1)
 
+    def __setattr__(self, name, value):
+        raise AttributeError('piece kinds are shared and cannot be changed')
 
-class Piece:
+    # copies and pickles refer back to the shared kind instead of building a new one
+    def __reduce__(self):
+        return piece_kind, (self.name, self.color)
 
-    def __init__(self, name, color, value, texture=None, texture_rect=None):
-        self.name = name
-        self.color = color
-        value_sign = 1 if color == 'white' else -1
-        self.value = value * value_sign
+    def __repr__(self):
+        return f'PieceKind({self.color} {self.name})'
+
+
+# values by piece name
+PIECE_VALUES_BY_NAME = {
+    'pawn': 1.0,
+    'knight': 3.0,
+    'bishop': 3.001,
+    'rook': 5.0,
+    'queen': 9.0,
+    'king': 10000.0,
+}
+
+# one shared kind per (name, color)
+PIECE_KINDS = {(name, color): PieceKind(name, color, value)
+               for name, value in PIECE_VALUES_BY_NAME.items() for color in ('white', 'black')}
+
+
+# shared kind of a piece name and color
+def piece_kind(name, color) -> PieceKind:
+    return PIECE_KINDS[(name, color)]
+
+
+class Piece:
+    '''
+    A piece on the board: its shared kind plus the state that differs per
+    piece. Images and screen positions are kept by the interface, not here.
+    '''
+    __slots__ = ('kind', 'moves', 'moved')
+
+    def __init__(self, name, color):
+        self.kind = PIECE_KINDS[(name, color)]
         self.moves = []
         self.moved = False
-        self.texture = texture
-        self.set_texture()
-        self.texture_rect = texture_rect
 
-    def set_texture(self, size=80):
-        self.texture = os.path.join(
-            f'../assets/images/imgs-{size}px/{self.color}_{self.name}.png')
+    @property
+    def name(self):
+        return self.kind.name
+
+    @property
+    def color(self):
+        return self.kind.color
+
+    @property
+    def value(self):
+        return self.kind.value
 
     def add_move(self, move):
         self.moves.append(move)
@@ -26,40 +75,58 @@ class Piece:
 
 
 class Pawn(Piece):
+    __slots__ = ('en_passant',)
 
     def __init__(self, color):
-        self.dir = -1 if color == 'white' else 1
         self.en_passant = False
-        super().__init__('pawn', color, 1.0)
+        super().__init__('pawn', color)
+
+    @property
+    def dir(self):
+        return self.kind.dir
 
 
 class Knight(Piece):
+    __slots__ = ()
 
     def __init__(self, color):
-        super().__init__('knight', color, 3.0)
+        super().__init__('knight', color)
 
 
 class Bishop(Piece):
+    __slots__ = ()
 
     def __init__(self, color):
-        super().__init__('bishop', color, 3.001)
+        super().__init__('bishop', color)
 
 
 class Rook(Piece):
+    __slots__ = ()
 
     def __init__(self, color):
-        super().__init__('rook', color, 5.0)
+        super().__init__('rook', color)
 
 
 class Queen(Piece):
+    __slots__ = ()
 
     def __init__(self, color):
-        super().__init__('queen', color, 9.0)
+        super().__init__('queen', color)
 
 
 class King(Piece):
+    __slots__ = ()
 
     def __init__(self, color):
-        self.left_rook = None
-        self.right_rook = None
-        super().__init__('king', color, 10000.0)
+        super().__init__('king', color)
+
+
+# piece classes by name, used when a pawn promotes
+PIECE_CLASSES = {
+    'pawn': Pawn,
+    'knight': Knight,
+    'bishop': Bishop,
+    'rook': Rook,
+    'queen': Queen,
+    'king': King,
+}
@@ -0,0 +1,347 @@
+'''
+Headless engine-vs-engine matches, one game per worker process at a time.
+
+    python selfplay.py --games 1000 --tc 10+0.1 --pgn games.pgn --stats games.jsonl
+    python selfplay.py --games 200 --movetime 100 --openings openings.txt --workers 8
+    python selfplay.py --engine-b mybranch_ai:AI_engine --depth 4
+
+Every opening is played twice with colors swapped. An openings file holds one
+opening per line, either coordinate moves from the start position
+(e2e4 e7e5 g1f3 or e4 e5 Nf3) or a FEN; empty lines and lines starting with # are skipped.
+'''
+import argparse
+import datetime
+import importlib
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bitboard import Position, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, popcount, move_name
+from pgn import move_to_san, san_to_move, write_game
+from const import *
+
+# plies without a capture or pawn move for the fifty-move rule
+FIFTY_MOVE_PLIES = 100
+# games longer than this are adjudicated a draw
+MAX_GAME_PLIES = 400
+
+# used when no openings file is given
+DEFAULT_OPENINGS = [
+    'e2e4 e7e5 g1f3 b8c6',
+    'e2e4 c7c5 g1f3 d7d6',
+    'e2e4 e7e6 d2d4 d7d5',
+    'e2e4 c7c6 d2d4 d7d5',
+    'd2d4 d7d5 c2c4 e7e6',
+    'd2d4 g8f6 c2c4 g7g6',
+    'd2d4 g8f6 c2c4 e7e6',
+    'c2c4 e7e5 b1c3 g8f6',
+    'g1f3 d7d5 g2g3 g8f6',
+    'e2e4 d7d5 e4d5 d8d5',
+]
+
+
+class TimeControl:
+    '''
+    Clock of one side: base time plus increment, or a fixed time per move.
+    '''
+
+    def __init__(self, base_ms=None, inc_ms=0, movetime_ms=None, depth=MAX_SEARCH_DEPTH):
+        self.base_ms = base_ms
+        self.inc_ms = inc_ms
+        self.movetime_ms = movetime_ms
+        self.depth = depth
+
+    # parses 'base+inc' in seconds, e.g. '10+0.1' or '60'
+    @classmethod
+    def parse(cls, text, depth=MAX_SEARCH_DEPTH):
+        base, _, inc = text.partition('+')
+        return cls(float(base) * 1000, float(inc or 0) * 1000, depth=depth)
+
+    # time budget of the next move given the time left, None for no limit
+    def budget(self, left_ms):
+        if self.movetime_ms is not None:
+            return self.movetime_ms
+        if self.base_ms is None:
+            return None
+        # spread the time left over the rest of the game, keep a margin for the overshoot
+        return max(1, min(left_ms / 25 + self.inc_ms, left_ms * 0.8))
+
+    # PGN TimeControl tag
+    def __str__(self):
+        if self.movetime_ms is not None:
+            return f'{self.movetime_ms / 1000:g}/move'
+        if self.base_ms is None:
+            return '-'
+        return f'{self.base_ms / 1000:g}+{self.inc_ms / 1000:g}'
+
+
+# reads an openings file, returns a list of opening lines
+def load_openings(path) -> list:
+    openings = []
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                openings.append(line)
+    return openings
+
+
+# sets an opening up, returns (position, FEN or None, SAN moves played)
+def setup_opening(opening):
+    if '/' in opening:
+        return Position.from_fen(opening), opening, []
+    position = Position.start()
+    played = []
+    for name in opening.split():
+        for move in position.legal_moves():
+            if move_name(move) == name:
+                break
+        else:
+            try:
+                move = san_to_move(position, name)
+            except ValueError:
+                raise ValueError(f'illegal opening move {name} in: {opening}') from None
+        played.append(move_to_san(position, move))
+        position.make(move)
+    return position, None, played
+
+
+# checks if neither side can mate: bare kings or a single minor piece
+def insufficient_material(position) -> bool:
+    for color in (WHITE, BLACK):
+        pieces = position.pieces[color]
+        if pieces[PAWN] or pieces[ROOK] or pieces[QUEEN]:
+            return False
+    minors = sum(popcount(position.pieces[color][KNIGHT] | position.pieces[color][BISHOP])
+                 for color in (WHITE, BLACK))
+    return minors <= 1
+
+
+# imports an engine class given as 'module:Class'
+def load_engine(spec):
+    module, _, name = spec.partition(':')
+    return getattr(importlib.import_module(module), name or 'AI_engine')
+
+
+# engines of a worker process by (spec, color), created once and reused for every game;
+# the sides never share an engine, so neither probes table entries of the other's search
+_engines = {}
+
+
+def _engine(spec, color):
+    engine = _engines.get((spec, color))
+    if engine is None:
+        engine = _engines[(spec, color)] = load_engine(spec)()
+    return engine
+
+
+# plays one game in a worker process, returns its record
+def play_game(index, opening, white_spec, black_spec, time_control):
+    '''
+    :param index: game number, for the record only
+    :param opening: coordinate moves or FEN to start from
+    :param white_spec: 'module:Class' of the white engine
+    :param black_spec: 'module:Class' of the black engine
+    :param time_control: TimeControl used by both sides
+    :return: dict with the result, moves and per-side statistics
+    '''
+    position, fen, opening_moves = setup_opening(opening)
+    specs = (white_spec, black_spec)
+    engines = (_engine(white_spec, WHITE), _engine(black_spec, BLACK))
+    for engine in engines:
+        engine.tt.clear()
+
+    left = [time_control.base_ms or 0, time_control.base_ms or 0]
+    nodes = [0, 0]
+    spent = [0.0, 0.0]
+    depths = [0, 0]
+    searches = [0, 0]
+    moves = []
+    result = termination = None
+
+    while result is None:
+        turn = position.turn
+        if not position.has_legal_move():
+            if position.in_check(turn):
+                result, termination = ('0-1' if turn == WHITE else '1-0'), 'checkmate'
+            else:
+                result, termination = '1/2-1/2', 'stalemate'
+            break
+        if position.halfmove >= FIFTY_MOVE_PLIES:
+            result, termination = '1/2-1/2', 'fifty-move rule'
+            break
+        # the first repetition ends the game, the search scores it as a draw too
+        if position.is_repetition():
+            result, termination = '1/2-1/2', 'repetition'
+            break
+        if insufficient_material(position):
+            result, termination = '1/2-1/2', 'insufficient material'
+            break
+        if len(moves) >= MAX_GAME_PLIES:
+            result, termination = '1/2-1/2', 'adjudication'
+            break
+
+        engine = engines[turn]
+        start = time.perf_counter()
+        move = engine.search_position(position, time_control.depth, time_control.budget(left[turn]))
+        elapsed = (time.perf_counter() - start) * 1000
+        spent[turn] += elapsed
+        nodes[turn] += engine.nodes
+        depths[turn] += engine.depth
+        searches[turn] += 1
+
+        if time_control.base_ms is not None and time_control.movetime_ms is None:
+            left[turn] -= elapsed
+            if left[turn] < 0:
+                result, termination = ('0-1' if turn == WHITE else '1-0'), 'time forfeit'
+                break
+            left[turn] += time_control.inc_ms
+
+        moves.append(move_to_san(position, move))
+        position.make(move)
+
+    return {
+        'game': index,
+        'opening': opening,
+        'fen': fen,
+        'opening_moves': opening_moves,
+        'white': specs[0],
+        'black': specs[1],
+        'result': result,
+        'termination': termination,
+        'moves': moves,
+        'plies': len(moves),
+        'time_control': str(time_control),
+        'nodes': nodes,
+        'time_ms': [round(ms, 1) for ms in spent],
+        'avg_depth': [depths[i] / searches[i] if searches[i] else 0 for i in (0, 1)],
+        'nps': [nodes[i] * 1000 / spent[i] if spent[i] else 0 for i in (0, 1)],
+    }
+
+
+# writes a game record as PGN
+def write_pgn(record, out, event='selfplay'):
+    headers = {
+        'Event': event,
+        'Site': 'local',
+        'Date': datetime.date.today().strftime('%Y.%m.%d'),
+        'Round': str(record['game'] + 1),
+        'White': record['white'],
+        'Black': record['black'],
+        'TimeControl': record['time_control'],
+        'Termination': record['termination'],
+        'PlyCount': str(len(record['opening_moves']) + record['plies']),
+    }
+    write_game(out, headers, record['opening_moves'] + record['moves'], record['result'], record['fen'])
+
+
+# score of engine a, which plays white in the even games, and the Elo difference
+def match_score(records):
+    wins = draws = losses = 0
+    for record in records:
+        if record['result'] == '1/2-1/2':
+            draws += 1
+        elif (record['result'] == '1-0') == (record['game'] % 2 == 0):
+            wins += 1
+        else:
+            losses += 1
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games if games else 0.5
+    if score <= 0 or score >= 1:
+        elo = math.copysign(math.inf, score - 0.5)
+    else:
+        elo = -400 * math.log10(1 / score - 1)
+    return wins, draws, losses, elo
+
+
+# plays a match, streaming every finished game to the output files
+def run_match(games, engine_a, engine_b, time_control, openings=DEFAULT_OPENINGS, workers=None,
+              pgn_path=None, stats_path=None, out=sys.stdout) -> list:
+    '''
+    :param games: number of games, colors alternate on every opening
+    :param engine_a: 'module:Class' of the first engine
+    :param engine_b: 'module:Class' of the second engine
+    :param time_control: TimeControl used by both sides
+    :param openings: opening lines, cycled through
+    :param workers: number of processes, one per core by default
+    :param pgn_path: file the games are appended to as PGN
+    :param stats_path: file the per-game statistics are appended to as JSON lines
+    :return: list of game records in the order they finished
+    '''
+    # fail early on an unknown engine or a bad opening
+    load_engine(engine_a)
+    load_engine(engine_b)
+    for opening in openings:
+        setup_opening(opening)
+
+    pgn = open(pgn_path, 'a') if pgn_path else None
+    stats = open(stats_path, 'a') if stats_path else None
+    records = []
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(workers or os.cpu_count() or 1) as pool:
+            futures = []
+            for index in range(games):
+                opening = openings[(index // 2) % len(openings)]
+                white, black = (engine_a, engine_b) if index % 2 == 0 else (engine_b, engine_a)
+                futures.append(pool.submit(play_game, index, opening, white, black, time_control))
+
+            for future in as_completed(futures):
+                record = future.result()
+                records.append(record)
+                if pgn:
+                    write_pgn(record, pgn)
+                    pgn.flush()
+                if stats:
+                    stats.write(json.dumps(record) + '\n')
+                    stats.flush()
+                wins, draws, losses, elo = match_score(records)
+                print(f'game {record["game"] + 1:>5} {record["result"]:<7} {record["termination"]:<21} '
+                      f'{len(records)}/{games}  +{wins} ={draws} -{losses}  elo {elo:+.0f}', file=out)
+    finally:
+        if pgn:
+            pgn.close()
+        if stats:
+            stats.close()
+
+    seconds = time.perf_counter() - start
+    nodes = sum(sum(record['nodes']) for record in records)
+    print(f'{len(records)} games in {seconds:.1f} s, {nodes / seconds if seconds else 0:.0f} nodes/s over all workers',
+          file=out)
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='headless engine-vs-engine games')
+    parser.add_argument('--games', type=int, default=100, help='number of games')
+    parser.add_argument('--engine-a', default='ai_chess:AI_engine', help='first engine as module:Class')
+    parser.add_argument('--engine-b', default='ai_chess:AI_engine', help='second engine as module:Class')
+    parser.add_argument('--tc', default=None, help='time control base+increment in seconds, e.g. 10+0.1')
+    parser.add_argument('--movetime', type=float, default=None, help='fixed time per move in milliseconds')
+    parser.add_argument('--depth', type=int, default=MAX_SEARCH_DEPTH, help='depth limit of every search')
+    parser.add_argument('--openings', help='openings file, coordinate or SAN moves or a FEN per line')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, one per core by default')
+    parser.add_argument('--pgn', help='PGN file the games are appended to')
+    parser.add_argument('--stats', help='JSON lines file the per-game statistics are appended to')
+    args = parser.parse_args(argv)
+
+    if args.movetime is not None:
+        time_control = TimeControl(movetime_ms=args.movetime, depth=args.depth)
+    elif args.tc is not None:
+        time_control = TimeControl.parse(args.tc, args.depth)
+    elif args.depth != MAX_SEARCH_DEPTH:
+        time_control = TimeControl(depth=args.depth)
+    else:
+        parser.error('give a time control with --tc or --movetime, or a --depth limit')
+    openings = load_openings(args.openings) if args.openings else DEFAULT_OPENINGS
+
+    run_match(args.games, args.engine_a, args.engine_b, time_control, openings, args.workers,
+              args.pgn, args.stats)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import os
+
+import pygame
+
+COLORS = ('white', 'black')
+NAMES = ('pawn', 'knight', 'bishop', 'rook', 'queen', 'king')
+SIZES = (80, 128)
+
+
+class Sprites:
+    '''
+    Piece images loaded once per size and converted for fast blitting.
+
+    With atlas=True the 12 images of a size are packed into one surface
+    (6 columns by 2 rows) and handed out as subsurfaces of it.
+    '''
+
+    def __init__(self, atlas=True):
+        self.atlas = atlas
+        # size -> atlas surface
+        self.atlases = {}
+        # (color, name, size) -> surface
+        self.images = {}
+
+    # image of a piece at the given size
+    def get(self, piece, size=80) -> pygame.Surface:
+        image = self.images.get((piece.color, piece.name, size))
+        if image is None:
+            self._load(size)
+            image = self.images[(piece.color, piece.name, size)]
+        return image
+
+    # loads every image of a size up front
+    def preload(self):
+        for size in SIZES:
+            if size not in self.atlases and (COLORS[0], NAMES[0], size) not in self.images:
+                self._load(size)
+
+    @staticmethod
+    def path(color, name, size):
+        return os.path.join(f'../assets/images/imgs-{size}px/{color}_{name}.png')
+
+    def _load(self, size):
+        images = {}
+        for color in COLORS:
+            for name in NAMES:
+                images[(color, name, size)] = pygame.image.load(self.path(color, name, size)).convert_alpha()
+
+        if not self.atlas:
+            self.images.update(images)
+            return
+
+        # pack the images in one surface, cell size fits the largest image
+        cell_w = max(image.get_width() for image in images.values())
+        cell_h = max(image.get_height() for image in images.values())
+        atlas = pygame.Surface((cell_w * len(NAMES), cell_h * len(COLORS)), pygame.SRCALPHA).convert_alpha()
+        atlas.fill((0, 0, 0, 0))
+        for row, color in enumerate(COLORS):
+            for col, name in enumerate(NAMES):
+                image = images[(color, name, size)]
+                rect = pygame.Rect(col * cell_w, row * cell_h, image.get_width(), image.get_height())
+                atlas.blit(image, rect)
+                self.images[(color, name, size)] = atlas.subsurface(rect)
+        self.atlases[size] = atlas
@@ -1,11 +1,16 @@
 class Square:
+    __slots__ = ('row', 'col', 'piece')
     ALPHACOLS = {0: 'a', 1: 'b', 2: 'c', 3: 'd', 4: 'e', 5: 'f', 6: 'g', 7: 'h'}
 
     def __init__(self, row: int, col: int, piece=None):
         self.row = row
         self.col = col
         self.piece = piece
-        self.alphacol = self.ALPHACOLS[col]
+
+    # column letter, looked up instead of stored per square
+    @property
+    def alphacol(self):
+        return self.ALPHACOLS[self.col]
 
     def __eq__(self, other):
         return self.row == other.row and self.col == other.col
@@ -35,5 +40,4 @@ class Square:
 
     @staticmethod
     def get_alphacol(col):
-        ALPHACOLS = {0: 'a', 1: 'b', 2: 'c', 3: 'd', 4: 'e', 5: 'f', 6: 'g', 7: 'h'}
-        return ALPHACOLS[col]
+        return Square.ALPHACOLS[col]
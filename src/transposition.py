@@ -0,0 +1,166 @@
+from array import array
+
+from const import *
+
+# bound types, 0 marks an empty slot
+BOUND_EXACT = 1
+BOUND_LOWER = 2
+BOUND_UPPER = 3
+
+# encoded moves with their flags fit in 18 bits
+MOVE_BITS = 0x3FFFF
+
+# slots per bucket and 64-bit words per slot
+BUCKET_SLOTS = 2
+SLOT_WORDS = 2
+
+
+class TranspositionTable:
+    '''
+    Fixed-size hash table of search results.
+
+    Every slot is two unsigned 64-bit words in one flat array: the position key
+    xor-ed with the data word, then the data word itself (18-bit move with its
+    flags, score, depth, bound, age). A slot is only trusted when both words agree with the probed
+    key, so a torn or foreign entry reads as a miss.
+    '''
+
+    def __init__(self, size_mb=TT_SIZE_MB, buffer=None):
+        '''
+        :param size_mb: memory cap in megabytes, rounded down to a power of two buckets
+        :param buffer: writable buffer of table_bytes(size_mb) bytes to keep the slots in,
+                       e.g. shared memory used by several processes
+        '''
+        buckets = self.table_bytes(size_mb) // (BUCKET_SLOTS * SLOT_WORDS * 8)
+        self.mask = buckets - 1
+        if buffer is None:
+            self.table = array('Q', bytes(buckets * BUCKET_SLOTS * SLOT_WORDS * 8))
+        else:
+            self.table = memoryview(buffer)[:buckets * BUCKET_SLOTS * SLOT_WORDS * 8].cast('Q')
+        # search generation, older entries are replaced first
+        self.age = 0
+        # statistics
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    # bytes the slots of a table of size_mb take
+    @staticmethod
+    def table_bytes(size_mb):
+        bucket_bytes = BUCKET_SLOTS * SLOT_WORDS * 8
+        buckets = 1
+        while buckets * 2 * bucket_bytes <= size_mb * 1024 * 1024:
+            buckets *= 2
+        return buckets * bucket_bytes
+
+    # number of slots in the table
+    def __len__(self):
+        return (self.mask + 1) * BUCKET_SLOTS
+
+    # memory used by the slots in bytes
+    def size_bytes(self):
+        return len(self.table) * 8
+
+    # looks a position up
+    def probe(self, key):
+        '''
+        :param key: zobrist key of the position
+        :return: (depth, score, bound, move) or None
+        '''
+        self.probes += 1
+        table = self.table
+        index = (key & self.mask) * BUCKET_SLOTS * SLOT_WORDS
+        occupied = False
+        for i in range(index, index + BUCKET_SLOTS * SLOT_WORDS, SLOT_WORDS):
+            data = table[i + 1]
+            if not data:
+                continue
+            if table[i] ^ data == key:
+                self.hits += 1
+                return (data >> 34) & 0xFF, ((data >> 18) & 0xFFFF) - 32768, (data >> 42) & 3, data & MOVE_BITS
+            occupied = True
+        # bucket filled by other positions
+        if occupied:
+            self.collisions += 1
+        return None
+
+    # stores a search result, replacing the shallowest or oldest slot of the bucket
+    def store(self, key, depth, score, bound, move):
+        '''
+        :param key: zobrist key of the position
+        :param depth: remaining depth of the search that produced score
+        :param score: score from the side to move's point of view
+        :param bound: BOUND_EXACT, BOUND_LOWER or BOUND_UPPER
+        :param move: best move found, 0 if none
+        '''
+        self.stores += 1
+        table = self.table
+        index = (key & self.mask) * BUCKET_SLOTS * SLOT_WORDS
+        victim = -1
+        victim_worth = 1 << 30
+        for i in range(index, index + BUCKET_SLOTS * SLOT_WORDS, SLOT_WORDS):
+            data = table[i + 1]
+            if not data:
+                victim = i
+                break
+            if table[i] ^ data == key:
+                # same position: keep the old move if the new result has none
+                if not move:
+                    move = data & MOVE_BITS
+                victim = i
+                break
+            # deep entries of the current search are worth keeping
+            age = (self.age - (data >> 44)) & 0x3F
+            worth = ((data >> 34) & 0xFF) - 4 * age
+            if worth < victim_worth:
+                victim = i
+                victim_worth = worth
+        else:
+            # every slot held another position
+            self.overwrites += 1
+
+        depth = max(0, min(depth, 0xFF))
+        data = move & MOVE_BITS | (score + 32768) << 18 | depth << 34 | bound << 42 | self.age << 44
+        table[victim] = key ^ data
+        table[victim + 1] = data
+
+    # starts a new search generation so that old entries age out
+    def new_search(self):
+        self.age = (self.age + 1) & 0x3F
+
+    def clear(self):
+        # in place, a shared buffer stays shared
+        self.table[:] = array('Q', bytes(len(self.table) * 8))
+        self.age = 0
+        self.probes = self.hits = self.collisions = self.stores = self.overwrites = 0
+
+    # lets go of a shared buffer so its owner can close it
+    def release(self):
+        if isinstance(self.table, memoryview):
+            self.table.release()
+
+    # permille of slots used, sampled from the first buckets
+    def hashfull(self):
+        sample = min(1000, len(self))
+        used = 0
+        for i in range(sample):
+            if self.table[i * SLOT_WORDS + 1]:
+                used += 1
+        return used * 1000 // sample
+
+    # statistics for sizing the table
+    def stats(self) -> dict:
+        return {
+            'size_mb': self.size_bytes() / (1024 * 1024),
+            'slots': len(self),
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.probes if self.probes else 0.0,
+            'collisions': self.collisions,
+            'collision_rate': self.collisions / self.probes if self.probes else 0.0,
+            'stores': self.stores,
+            'overwrites': self.overwrites,
+            'hashfull': self.hashfull(),
+        }
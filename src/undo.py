@@ -0,0 +1,24 @@
+class Undo:
+    __slots__ = ('move', 'piece', 'moved', 'last_move', 'en_passant_pawn', 'captured', 'captured_row', 'captured_col',
+                 'rook', 'rook_from', 'rook_to', 'rook_moved')
+
+    def __init__(self, move, piece, moved, last_move, en_passant_pawn):
+        # move that was made and the piece that made it
+        self.move = move
+        self.piece = piece
+        # state of the board before the move
+        self.moved = moved
+        self.last_move = last_move
+        self.en_passant_pawn = en_passant_pawn
+        # captured piece and where it stood (differs from final for en passant)
+        self.captured = None
+        self.captured_row = 0
+        self.captured_col = 0
+        # castling rook, its columns and its moved flag
+        self.rook = None
+        self.rook_from = 0
+        self.rook_to = 0
+        self.rook_moved = False
+
+    def __str__(self):
+        return f'undo {self.move}'